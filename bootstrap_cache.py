@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# Bootstrap Cache Helpers (Python)
+# Remembers where ansible-playbook and the system package manager live so the
+# setup scripts don't re-probe $PATH on every launch. The cache is invalidated
+# whenever $PATH changes or the caller asks for a refresh (--refresh-cache /
+# ANSIBLE_SETUP_REFRESH_CACHE=1); each entry also lapses when its own binary changes.
+# Also records the hash of the last successfully installed requirements.yml so
+# unchanged Galaxy collections aren't re-resolved on every run, runs the Galaxy
+# install in the background while the user answers prompts, and tells the
+# installers whether the system package metadata is fresh enough to reuse.
+# Successful SSH login probes are remembered per host/user/key for a day.
+
+import os
+import sys
+import glob
+import time
+import json
+import shutil
+import hashlib
+import tempfile
+import functools
+import subprocess
+
+# --- Configuration ---
+CACHE_DIR = os.path.expanduser("~/.cache/ansible-new-setup")
+BOOTSTRAP_CACHE_FILE = os.path.join(CACHE_DIR, "bootstrap.json")
+GALAXY_HASH_FILE = os.path.join(CACHE_DIR, "galaxy.sha")
+SSH_CHECK_CACHE_FILE = os.path.join(CACHE_DIR, "hosts.json")
+SSH_CHECK_MAX_AGE = 86400 # Seconds a successful SSH login probe stays trusted
+COLLECTIONS_DIR = os.path.expanduser("~/.ansible/collections")
+PACKAGE_MANAGERS = ["apt-get", "dnf", "pacman", "brew"] # Probe order
+REFRESH_ENV_VAR = "ANSIBLE_SETUP_REFRESH_CACHE"
+PACKAGE_CACHE_MAX_AGE = 3600 # Seconds before package manager metadata counts as stale
+
+def _path_hash():
+    return hashlib.sha256(os.environ.get("PATH", "").encode("utf-8")).hexdigest()
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+def _refresh_requested(refresh):
+    return refresh or os.environ.get(REFRESH_ENV_VAR) == "1"
+
+def _write_atomic(path, content):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "w") as f:
+        f.write(content)
+    os.replace(tmp_file, path)
+
+def _file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def load_bootstrap_cache(refresh=False):
+    """Returns the cached probe results, or {} if missing, refreshed or recorded under another $PATH."""
+    if _refresh_requested(refresh):
+        return {}
+    try:
+        with open(BOOTSTRAP_CACHE_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get("path_hash") != _path_hash():
+        return {}
+    return cache
+
+def save_bootstrap_cache(key, name, path):
+    """Records that the lookup for key found name at path; failures to write are silently ignored."""
+    cache = load_bootstrap_cache()
+    cache[key] = {"name": name, "path": path, "mtime": _mtime(path)}
+    cache["path_hash"] = _path_hash()
+    try:
+        _write_atomic(BOOTSTRAP_CACHE_FILE, json.dumps(cache))
+    except OSError:
+        pass
+
+@functools.lru_cache(maxsize=None)
+def path_index():
+    """Maps the name of every entry in the $PATH directories to the directories holding it.
+
+    Each directory is listed once, in $PATH order. The result is cached for the life of
+    the process; call path_index.cache_clear() after installing something that should show up.
+    """
+    index = {}
+    for directory in os.environ.get("PATH", "").split(os.pathsep):
+        directory = directory or "."
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        for name in names:
+            index.setdefault(name, []).append(directory)
+    return index
+
+def on_path(name):
+    """Returns True if name is an executable file in one of the $PATH directories, like shutil.which."""
+    for directory in path_index().get(name, ()):
+        path = os.path.join(directory, name)
+        # isfile() follows symlinks, so a dangling link or a directory doesn't count
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return True
+    return False
+
+def _probe_package_manager():
+    for pkg_mgr in PACKAGE_MANAGERS:
+        if on_path(pkg_mgr):
+            return pkg_mgr
+    return None
+
+def _cached_lookup(key, refresh):
+    """Returns the cached name for key if the binary it was found at is still there and unchanged."""
+    entry = load_bootstrap_cache(refresh).get(key)
+    if not isinstance(entry, dict) or not entry.get("path") or _mtime(entry["path"]) != entry.get("mtime"):
+        return None
+    return entry.get("name")
+
+def find_ansible_playbook(refresh=False):
+    """Returns the path to ansible-playbook (None if not installed)."""
+    cached = _cached_lookup("ansible_playbook", refresh)
+    if cached:
+        return cached
+    ansible_playbook = shutil.which("ansible-playbook")
+    if ansible_playbook:
+        # Only positive results are cached, so a fresh install is picked up next run
+        save_bootstrap_cache("ansible_playbook", ansible_playbook, ansible_playbook)
+    return ansible_playbook
+
+def detect_package_manager(refresh=False):
+    """Returns the first available package manager from PACKAGE_MANAGERS, or None."""
+    cached = _cached_lookup("pkg_mgr", refresh)
+    if cached:
+        return cached
+    pkg_mgr = _probe_package_manager()
+    pkg_mgr_path = pkg_mgr and shutil.which(pkg_mgr)
+    if pkg_mgr_path:
+        save_bootstrap_cache("pkg_mgr", pkg_mgr, pkg_mgr_path)
+    return pkg_mgr
+
+def galaxy_requirements_cached(requirements_file):
+    """Returns True if requirements_file is unchanged since the last successful collection install."""
+    try:
+        with open(GALAXY_HASH_FILE) as f:
+            cached_hash = f.read().strip()
+        # Collections must still be on disk; installing into an existing tree doesn't bump its mtime,
+        # so the hash alone decides whether requirements.yml changed since the last install
+        if not os.path.isdir(COLLECTIONS_DIR):
+            return False
+        return cached_hash == _file_sha256(requirements_file)
+    except OSError:
+        return False
+
+def record_galaxy_requirements(requirements_file):
+    """Stores the hash of requirements_file after a successful collection install."""
+    try:
+        _write_atomic(GALAXY_HASH_FILE, _file_sha256(requirements_file) + "\n")
+    except OSError:
+        pass
+
+def start_galaxy_install(requirements_file, log_info, log_error):
+    """Starts ansible-galaxy without waiting; returns (process, log file) or None if it can't be run.
+
+    log_info and log_error are the calling script's log helpers.
+    """
+    log_info("Installing/updating Ansible collections from requirements.yml in the background...")
+    command = ["ansible-galaxy", "collection", "install", "-r", str(requirements_file)]
+    log_info(f"Executing: {' '.join(command)}")
+    # Output goes to a temp file rather than a pipe: nobody drains a pipe while the menu is up,
+    # and a full pipe buffer would stall the install.
+    log_file = tempfile.TemporaryFile(mode="w+", encoding="utf-8")
+    try:
+        process = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT)
+    except FileNotFoundError:
+        log_error(f"Command not found: {command[0]}")
+        log_file.close()
+        return None
+    return process, log_file
+
+def wait_for_galaxy_install(galaxy_job, requirements_file, log_info, log_success, log_error):
+    """Waits for a start_galaxy_install() job and records requirements_file; exits the script if it failed."""
+    if galaxy_job is None:
+        return
+    process, log_file = galaxy_job
+    log_info("Waiting for Ansible collection installation to finish...")
+    returncode = process.wait()
+    log_file.seek(0)
+    output = log_file.read()
+    log_file.close()
+    if returncode != 0:
+        log_error(f"Ansible collection installation failed (return code {returncode}):\n{output.strip()}")
+        sys.exit(1)
+    record_galaxy_requirements(requirements_file)
+    log_success("Ansible collections processed.")
+
+def package_cache_is_fresh(stamp_pattern, max_age=PACKAGE_CACHE_MAX_AGE):
+    """Returns True if the newest file matching stamp_pattern was modified within max_age seconds."""
+    mtimes = [os.path.getmtime(path) for path in glob.glob(stamp_pattern)]
+    return bool(mtimes) and time.time() - max(mtimes) < max_age
+
+def _ssh_check_key(host, port, user, key_path):
+    try:
+        key_hash = _file_sha256(key_path) if key_path else ""
+    except OSError:
+        key_hash = ""
+    return f"{user}@{host}:{port}:{key_hash}"
+
+def _load_ssh_checks():
+    try:
+        with open(SSH_CHECK_CACHE_FILE) as f:
+            checks = json.load(f)
+        return checks if isinstance(checks, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def ssh_check_cached(host, port, user, key_path):
+    """Returns True if logging in as user@host:port with key_path succeeded within SSH_CHECK_MAX_AGE."""
+    entry = _load_ssh_checks().get(_ssh_check_key(host, port, user, key_path))
+    return bool(entry) and entry.get("ok") is True and entry.get("ts", 0) > time.time() - SSH_CHECK_MAX_AGE
+
+def record_ssh_check(host, port, user, key_path, ok):
+    """Stores the outcome of an SSH login probe."""
+    checks = _load_ssh_checks()
+    checks[_ssh_check_key(host, port, user, key_path)] = {"ok": ok, "ts": time.time()}
+    try:
+        _write_atomic(SSH_CHECK_CACHE_FILE, json.dumps(checks))
+    except OSError:
+        pass
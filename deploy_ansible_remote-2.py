@@ -8,18 +8,49 @@
 import os
 import sys
 import subprocess
-import shutil
 import getpass
 import time
 import ipaddress
+import socket
+import logging
+import collections
+from pathlib import Path
+
+from bootstrap_cache import (package_cache_is_fresh, on_path,
+                             galaxy_requirements_cached, record_galaxy_requirements,
+                             ssh_check_cached, record_ssh_check)
 
 # --- Configuration ---
-PLAYBOOK_DIR = os.path.dirname(os.path.abspath(__file__)) # Assumes script is in 'files'
-PLAYBOOK_DIR = os.path.dirname(PLAYBOOK_DIR) # Go up one level to project root
-INVENTORY_DIR = os.path.join(PLAYBOOK_DIR, "inventory")
-INVENTORY_FILE = os.path.join(INVENTORY_DIR, "remote_hosts.ini")
-# Default inventory template for a single remote server
-DEFAULT_INVENTORY_TEMPLATE = "[remote_servers]\n{server_hostname} ansible_host={server_ip} ansible_user={ssh_user} ansible_port={ssh_port} {ssh_key_option}\n"
+_HERE = Path(__file__).resolve()
+PLAYBOOK_DIR = str(_HERE.parent) # Script lives at the project root, next to site.yml
+INVENTORY_DIR = str(_HERE.parent / "inventory")
+INVENTORY_FILE = str(_HERE.parent / "inventory" / "remote_hosts.ini")
+REQUIREMENTS_FILE = str(_HERE.parent / "requirements.yml")
+# Inventory for a single remote server; the host line itself is assembled in create_inventory_file()
+INVENTORY_GROUP_HEADER = "[remote_servers]\n"
+INVENTORY_GROUP_VARS = "[remote_servers:vars]\nansible_ssh_pipelining=true\n"
+APT_LISTS_DIR = "/var/lib/apt/lists" # mtime bumps on every 'apt-get update'
+# Parallelism: scale forks with the controller's cores, within sane bounds
+ANSIBLE_FORKS = max(5, min(50, (os.cpu_count() or 1) * 4))
+OUTPUT_TAIL_LINES = 200 # Lines of captured command output kept for results and error reports
+CONNECT_TIMEOUT = 3 # Seconds for the TCP reachability probe
+SSH_PROBE_TIMEOUT = 5 # Seconds for the non-interactive SSH login probe
+FACT_CACHE_DIR = os.path.expanduser("~/.cache/ansible-new-setup/facts")
+# Environment for the playbook run: SSH pipelining plus a persistent multiplexed connection per host,
+# parallel free-running hosts, and cached facts so reruns skip re-gathering
+ANSIBLE_RUN_ENV = {
+    "ANSIBLE_PIPELINING": "True",
+    "ANSIBLE_SSH_PIPELINING": "True",
+    # accept-new records unseen host keys without an interactive round-trip but still rejects changed ones
+    "ANSIBLE_SSH_ARGS": "-o ControlMaster=auto -o ControlPersist=60s -o ConnectionAttempts=5 -o PreferredAuthentications=publickey,password -o StrictHostKeyChecking=accept-new",
+    # 'free' lets each host run ahead instead of waiting for every host at each task
+    "ANSIBLE_STRATEGY": "free",
+    "ANSIBLE_FORKS": str(ANSIBLE_FORKS),
+    "ANSIBLE_GATHERING": "smart",
+    "ANSIBLE_CACHE_PLUGIN": "jsonfile",
+    "ANSIBLE_CACHE_PLUGIN_CONNECTION": FACT_CACHE_DIR,
+    "ANSIBLE_CACHE_PLUGIN_TIMEOUT": "3600",
+}
 
 # --- Color Codes for Output ---
 class Colors:
@@ -31,58 +62,151 @@ class Colors:
     BOLD = '\033[1m'
     NC = '\033[0m' # No Color
 
-# --- Helper Functions ---
-def log_info(message):
-    print(f"{Colors.BLUE}[INFO]{Colors.NC} {message}")
-
-def log_success(message):
-    print(f"{Colors.GREEN}[SUCCESS]{Colors.NC} {message}")
-
-def log_warning(message):
-    print(f"{Colors.YELLOW}[WARNING]{Colors.NC} {message}")
+CLEAR_SCREEN = '\033[2J\033[H' # Erase display + cursor home; avoids spawning clear/cls
+
+# --- Logging ---
+SUCCESS = 25 # Between INFO and WARNING
+logging.addLevelName(SUCCESS, "SUCCESS")
+
+class ColorFormatter(logging.Formatter):
+    """Prepends the colored [LEVEL] tag used throughout these scripts."""
+    PREFIXES = {
+        logging.INFO: f"{Colors.BLUE}[INFO]{Colors.NC}",
+        SUCCESS: f"{Colors.GREEN}[SUCCESS]{Colors.NC}",
+        logging.WARNING: f"{Colors.YELLOW}[WARNING]{Colors.NC}",
+        logging.ERROR: f"{Colors.RED}[ERROR]{Colors.NC}",
+    }
+
+    def format(self, record):
+        return f"{self.PREFIXES.get(record.levelno, f'[{record.levelname}]')} {record.getMessage()}"
+
+def _setup_logger():
+    log = logging.getLogger("deploy_ansible_remote")
+    level = os.environ.get("ANSIBLE_DEPLOY_LOG_LEVEL", "INFO").upper()
+    # Unknown names would make setLevel() raise at import time
+    log.setLevel(level if isinstance(logging.getLevelName(level), int) else logging.INFO)
+    log.propagate = False
+    stdout_handler = logging.StreamHandler(sys.stdout)
+    stdout_handler.addFilter(lambda record: record.levelno < logging.ERROR)
+    stderr_handler = logging.StreamHandler(sys.stderr)
+    stderr_handler.setLevel(logging.ERROR)
+    for handler in (stdout_handler, stderr_handler):
+        handler.setFormatter(ColorFormatter())
+        log.addHandler(handler)
+    return log
+
+logger = _setup_logger()
 
-def log_error(message):
-    print(f"{Colors.RED}[ERROR]{Colors.NC} {message}", file=sys.stderr)
-
-def run_command(command, check=True, capture_output=False):
-    """Runs a shell command and returns the result."""
-    log_info(f"Executing: {' '.join(command)}")
+# --- Helper Functions ---
+def log_info(message, *args):
+    logger.info(message, *args)
+
+def log_success(message, *args):
+    logger.log(SUCCESS, message, *args)
+
+def log_warning(message, *args):
+    logger.warning(message, *args)
+
+def log_error(message, *args):
+    logger.error(message, *args)
+
+def run_command(command, check=True, capture_output=False, env=None, cwd=None):
+    """Runs a shell command and returns the result.
+
+    Without capture_output the child writes straight to this terminal, so output streams
+    live and is never buffered here. With capture_output, stdout and stderr are merged and
+    streamed line by line into a bounded buffer; only the last OUTPUT_TAIL_LINES lines are
+    kept and returned as (output, "").
+    env, if given, replaces the child's environment; cwd sets the child's working
+    directory without changing this process's.
+    """
+    command_str = None # Joined lazily, and only once, when something actually logs it
+    if logger.isEnabledFor(logging.INFO):
+        command_str = ' '.join(command)
+        log_info("Executing: %s", command_str)
     try:
-        result = subprocess.run(command, check=check, capture_output=capture_output, text=True, encoding='utf-8')
-        if capture_output:
-            return result.stdout.strip(), result.stderr.strip()
-        return result.returncode == 0
+        if not capture_output:
+            returncode = subprocess.run(command, env=env, cwd=cwd).returncode
+            tail = None
+        else:
+            tail = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+            with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                                  encoding='utf-8', bufsize=1, env=env, cwd=cwd) as proc:
+                for line in proc.stdout:
+                    tail.append(line)
+            returncode = proc.returncode
     except FileNotFoundError:
-        log_error(f"Command not found: {command[0]}")
+        log_error("Command not found: %s", command[0])
         return False
-    except subprocess.CalledProcessError as e:
-        log_error(f"Command failed: {' '.join(command)}")
-        if capture_output:
-            log_error(f"Stdout: {e.stdout.strip()}")
-            log_error(f"Stderr: {e.stderr.strip()}")
+    if check and returncode != 0:
+        log_error("Command failed: %s", command_str or ' '.join(command))
+        if tail is not None:
+            log_error("Output (last %s lines):\n%s", OUTPUT_TAIL_LINES, ''.join(tail).strip())
         else:
-            log_error(f"Return code: {e.returncode}")
+            log_error("Return code: %s", returncode)
         return False
+    if tail is not None:
+        return ''.join(tail).strip(), ""
+    return returncode == 0
 
 # --- Function to Install Ansible ---
+# /etc/os-release ID (or ID_LIKE entry) -> package manager
+OS_RELEASE_PKG_MGRS = {
+    "ubuntu": "apt", "debian": "apt",
+    "fedora": "dnf", "rhel": "dnf", "centos": "dnf", "rocky": "dnf", "almalinux": "dnf",
+    "arch": "pacman", "manjaro": "pacman",
+}
+
+def detect_pkg_mgr():
+    """Detects the package manager from the platform and /etc/os-release, falling back to a PATH probe."""
+    if sys.platform == "darwin":
+        return "brew"
+    try:
+        with open("/etc/os-release") as f:
+            os_release = dict(line.rstrip("\n").split("=", 1) for line in f if "=" in line)
+        ids = [os_release.get("ID", "").strip('"')] + os_release.get("ID_LIKE", "").strip('"').split()
+        for os_id in ids:
+            if os_id in OS_RELEASE_PKG_MGRS:
+                return OS_RELEASE_PKG_MGRS[os_id]
+    except OSError:
+        pass
+    # Unknown distribution: fall back to whichever package manager is installed
+    for pkg_mgr, binary in (("apt", "apt-get"), ("dnf", "dnf"), ("pacman", "pacman"), ("brew", "brew")):
+        if on_path(binary):
+            return pkg_mgr
+    return None
+
+def _install_apt():
+    log_info("Using apt-get (Debian/Ubuntu)...")
+    install_cmd = "DEBIAN_FRONTEND=noninteractive apt-get install -y --no-install-recommends ansible"
+    if package_cache_is_fresh(APT_LISTS_DIR):
+        log_info("apt package lists are up to date. Skipping 'apt-get update'.")
+    else:
+        install_cmd = "apt-get update -qq && " + install_cmd
+    # Update and install share one sudo/sh invocation
+    run_command(["sudo", "sh", "-c", install_cmd])
+
+def _install_dnf():
+    log_info("Using dnf (Fedora/RHEL)...")
+    run_command(["sudo", "dnf", "install", "-y", "ansible"])
+
+def _install_pacman():
+    log_info("Using pacman (Arch Linux)...")
+    run_command(["sudo", "pacman", "-Sy", "--noconfirm", "ansible"])
+
+def _install_brew():
+    log_info("Using brew (macOS)...")
+    run_command(["brew", "install", "ansible"])
+
+ANSIBLE_INSTALLERS = {"apt": _install_apt, "dnf": _install_dnf, "pacman": _install_pacman, "brew": _install_brew}
+
 def install_ansible():
     log_info("Ansible not found. Installing based on your OS...")
-    if shutil.which("apt-get"):
-        log_info("Using apt-get (Debian/Ubuntu)...")
-        run_command(["sudo", "apt-get", "update"])
-        run_command(["sudo", "apt-get", "install", "-y", "ansible"])
-    elif shutil.which("dnf"):
-        log_info("Using dnf (Fedora/RHEL)...")
-        run_command(["sudo", "dnf", "install", "-y", "ansible"])
-    elif shutil.which("pacman"):
-        log_info("Using pacman (Arch Linux)...")
-        run_command(["sudo", "pacman", "-Sy", "--noconfirm", "ansible"])
-    elif shutil.which("brew"):
-        log_info("Using brew (macOS)...")
-        run_command(["brew", "install", "ansible"])
-    else:
+    installer = ANSIBLE_INSTALLERS.get(detect_pkg_mgr())
+    if installer is None:
         log_error("Unsupported package manager. Please install Ansible manually and re-run this script.")
         sys.exit(1)
+    installer()
     log_success("Ansible installed successfully.")
 
 # --- Function to Prompt for Server Details ---
@@ -93,17 +217,21 @@ def prompt_for_server_details():
         if not server_ip:
             log_warning("Server IP/Hostname cannot be empty.")
             continue
-        try:
-            # Basic validation for IP address or hostname
-            ipaddress.ip_address(server_ip) # Checks for IPv4/IPv6
-            break
-        except ValueError:
-            # Not an IP, could be a hostname. For simplicity, we'll accept any non-empty string.
-            # More robust hostname validation could be added if needed.
-            if server_ip.replace('-', '').replace('.', '').isalnum() or ' ' not in server_ip : # Basic hostname check
-                 break
-            log_warning("Invalid IP address or hostname format. Please try again.")
-            continue
+        # IPv4 addresses never contain letters and IPv6 addresses always contain ':',
+        # so obvious hostnames skip the ipaddress parse (and its ValueError) entirely
+        looks_like_hostname = ':' not in server_ip and any(c.isalpha() for c in server_ip)
+        if not looks_like_hostname:
+            try:
+                # Basic validation for IP address or hostname
+                ipaddress.ip_address(server_ip) # Checks for IPv4/IPv6
+                break
+            except ValueError:
+                pass
+        # Not an IP, could be a hostname. For simplicity, we'll accept any non-empty string.
+        # More robust hostname validation could be added if needed.
+        if server_ip.replace('-', '').replace('.', '').isalnum() or ' ' not in server_ip : # Basic hostname check
+             break
+        log_warning("Invalid IP address or hostname format. Please try again.")
 
     ssh_user = input("SSH Username (e.g., 'ubuntu', 'ec2-user'): ").strip()
     if not ssh_user:
@@ -115,33 +243,67 @@ def prompt_for_server_details():
         if not ssh_port_input:
             ssh_port = 22
             break
-        try:
-            ssh_port = int(ssh_port_input)
-            if 1 <= ssh_port <= 65535:
-                break
-            else:
-                log_warning("Port must be between 1 and 65535.")
-        except ValueError:
+        if not ssh_port_input.isdecimal(): # isdecimal, unlike isdigit, only accepts what int() parses
             log_warning("Invalid port number. Please enter a number.")
+            continue
+        ssh_port = int(ssh_port_input)
+        if 0 < ssh_port < 65536:
+            break
+        log_warning("Port must be between 1 and 65535.")
     
     ssh_key_path = input("Path to SSH Private Key (leave blank if using password): ").strip()
     ssh_key_option = ""
     if ssh_key_path:
         if not os.path.exists(ssh_key_path):
-            log_error(f"SSH key file not found at '{ssh_key_path}'. Please check the path.")
+            log_error("SSH key file not found at '%s'. Please check the path.", ssh_key_path)
             # Ask if user wants to continue without key or re-enter
             if not input("Continue without SSH key and use password prompt? (y/N): ").lower().startswith('y'):
                 sys.exit(1)
             ssh_key_path = "" # Reset to blank if not continuing
         else:
             ssh_key_option = f"ansible_ssh_private_key_file='{ssh_key_path}'"
-            log_info(f"Using SSH key: {ssh_key_path}")
+            log_info("Using SSH key: %s", ssh_key_path)
     else:
         log_info("No SSH key provided. Ansible will prompt for SSH password if key is not available or agent is not running.")
     
     return server_ip, ssh_user, ssh_port, ssh_key_option, ssh_key_path
 
 
+# --- Function to Check SSH Connectivity ---
+def check_ssh_connectivity(server_ip, ssh_user, ssh_port, ssh_key_path):
+    """Catches unreachable hosts and rejected keys before ansible-playbook spends 30+ seconds failing."""
+    log_info("Checking connectivity to %s:%s...", server_ip, ssh_port)
+    try:
+        with socket.create_connection((server_ip, ssh_port), timeout=CONNECT_TIMEOUT):
+            pass
+    except OSError as e:
+        log_error("Cannot reach %s:%s: %s", server_ip, ssh_port, e)
+        return False
+    if not ssh_key_path:
+        return True # Password logins can't be probed non-interactively
+
+    if ssh_check_cached(server_ip, ssh_port, ssh_user, ssh_key_path):
+        log_success("SSH key login verified recently (cached).")
+        return True
+    probe = ["ssh", "-o", "BatchMode=yes", "-o", f"ConnectTimeout={SSH_PROBE_TIMEOUT}",
+             "-o", "StrictHostKeyChecking=accept-new", "-i", ssh_key_path, "-p", str(ssh_port),
+             f"{ssh_user}@{server_ip}", "true"]
+    try:
+        ok = subprocess.run(probe, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            timeout=SSH_PROBE_TIMEOUT * 2).returncode == 0
+    except FileNotFoundError:
+        log_warning("ssh client not found. Skipping SSH login check.")
+        return True
+    except subprocess.TimeoutExpired:
+        ok = False
+    record_ssh_check(server_ip, ssh_port, ssh_user, ssh_key_path, ok)
+    if not ok:
+        log_error("SSH login as %s@%s with key '%s' failed.", ssh_user, server_ip, ssh_key_path)
+        return False
+    log_success("SSH key login verified.")
+    return True
+
+
 # --- Function to Display Interactive Menu ---
 AVAILABLE_ROLES = [
     "os-detection", "prerequisites", "base-installs", "docker-setup",
@@ -151,74 +313,141 @@ AVAILABLE_ROLES = [
 
 ALL_ROLES_SELECTION = [r for r in AVAILABLE_ROLES if r != "cloud-init"]
 FULL_ROLES_SELECTION = AVAILABLE_ROLES[:]
+ROLE_TO_IDX = {name: i for i, name in enumerate(AVAILABLE_ROLES)}
+# Menu indices covered by each special option
+SPECIAL_IDX = {
+    "all": frozenset(ROLE_TO_IDX[r] for r in ALL_ROLES_SELECTION),
+    "full": frozenset(ROLE_TO_IDX[r] for r in FULL_ROLES_SELECTION),
+}
+# Menu fragments are built once; a redraw only picks the selected/unselected variant per line
+SPECIAL_OPTIONS_ORDER = ["all", "full"]
+SPECIAL_DESCRIPTIONS = {"all": "all except cloud-init", "full": "all roles including cloud-init"}
+MENU_LABELS = AVAILABLE_ROLES + [f"{key} ({SPECIAL_DESCRIPTIONS[key]})" for key in SPECIAL_OPTIONS_ORDER]
+LINE_UNSEL = [f" [ ] {label}" for label in MENU_LABELS]
+LINE_SEL = [f" {Colors.GREEN}[✔]{Colors.NC} {label}" for label in MENU_LABELS]
+MENU_RULE = "-" * 80
+MENU_HEADER = "\n".join([
+    CLEAR_SCREEN + f"{Colors.BOLD}Select roles/features to install on the remote server:{Colors.NC}",
+    f"Use {Colors.CYAN}UP/DOWN{Colors.NC} arrows to navigate, {Colors.CYAN}SPACE{Colors.NC} to select/deselect, {Colors.CYAN}Enter{Colors.NC} to confirm, {Colors.CYAN}Q{Colors.NC} to quit.",
+    MENU_RULE,
+])
+
+# --- Key Readers for the Interactive Menu ---
+# Both yield normalized tokens: "UP", "DOWN", "SPACE", "ENTER", "Q"; the POSIX reader
+# also yields "REDRAW" when the terminal is resized.
+def key_iter_windows():
+    import msvcrt
+    while True:
+        key = msvcrt.getch()
+        if key in (b'\xe0', b'\x00'): # Arrow key prefix
+            arrow_key = msvcrt.getch()
+            if arrow_key == b'H':
+                yield "UP"
+            elif arrow_key == b'P':
+                yield "DOWN"
+        elif key == b'\r':
+            yield "ENTER"
+        elif key == b' ':
+            yield "SPACE"
+        elif key in (b'q', b'Q'):
+            yield "Q"
+
+POSIX_KEYS = {
+    b'\x1b[A': "UP", b'\x1b[B': "DOWN",
+    b'\x1bOA': "UP", b'\x1bOB': "DOWN", # Application cursor mode
+    b' ': "SPACE", b'\r': "ENTER", b'\n': "ENTER", b'q': "Q", b'Q': "Q",
+}
+ESCAPE_TIMEOUT = 0.05 # Seconds to wait for the rest of an escape sequence after a lone ESC
+
+def key_iter_posix():
+    import termios, tty, select, selectors, signal
+    fd = sys.stdin.fileno()
+    old_settings = termios.tcgetattr(fd)
+    # Terminal resizes wake the loop through a self-pipe so the menu redraws without waiting for a key
+    wake_r, wake_w = os.pipe()
+    os.set_blocking(wake_r, False)
+    os.set_blocking(wake_w, False)
+    old_wakeup_fd = signal.set_wakeup_fd(wake_w)
+    old_winch_handler = signal.signal(signal.SIGWINCH, lambda signum, frame: None) # Wakeup fd needs a Python handler
+    sel = selectors.DefaultSelector()
+    sel.register(fd, selectors.EVENT_READ)
+    sel.register(wake_r, selectors.EVENT_READ)
+    # Switch the terminal mode once for the whole menu rather than per keystroke.
+    # cbreak (not raw) keeps output post-processing and Ctrl-C working.
+    tty.setcbreak(fd)
+    try:
+        while True:
+            for key, _ in sel.select():
+                if key.fd == wake_r:
+                    if signal.SIGWINCH in os.read(wake_r, 64):
+                        yield "REDRAW"
+                    continue
+                # One read() per keypress: an arrow key's whole ESC [ X sequence arrives together
+                buf = os.read(fd, 8)
+                if not buf: # stdin closed
+                    yield "Q"
+                    return
+                if buf == b'\x1b' and select.select([fd], [], [], ESCAPE_TIMEOUT)[0]:
+                    buf += os.read(fd, 8) # Sequence split across reads
+                i = 0
+                while i < len(buf):
+                    size = 3 if buf[i:i+1] == b'\x1b' else 1
+                    token = POSIX_KEYS.get(buf[i:i+size])
+                    if token:
+                        yield token
+                    i += size
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
+        signal.signal(signal.SIGWINCH, old_winch_handler)
+        signal.set_wakeup_fd(old_wakeup_fd)
+        sel.close()
+        os.close(wake_r)
+        os.close(wake_w)
+
+def get_key_iter():
+    if os.name == 'nt': # Windows
+        os.system('') # Lets the Windows console interpret ANSI escape sequences
+        return key_iter_windows()
+    return key_iter_posix()
 
 def display_menu():
     selected_indices = set()
     current_index = 0
     num_options = len(AVAILABLE_ROLES)
-    special_options = {"all": ALL_ROLES_SELECTION, "full": FULL_ROLES_SELECTION}
-    special_options_order = ["all", "full"]
-    total_options = num_options + len(special_options)
+    total_options = num_options + len(SPECIAL_OPTIONS_ORDER)
 
     def print_menu():
-        os.system('clear' if os.name == 'posix' else 'cls') # Clear screen
-        print(f"{Colors.BOLD}Select roles/features to install on the remote server:{Colors.NC}")
-        print(f"Use {Colors.CYAN}UP/DOWN{Colors.NC} arrows to navigate, {Colors.CYAN}SPACE{Colors.NC} to select/deselect, {Colors.CYAN}Enter{Colors.NC} to confirm, {Colors.CYAN}Q{Colors.NC} to quit.")
-        print("-" * 80)
+        # Special options show as selected when all of their roles are selected
+        selected = [i in selected_indices for i in range(num_options)]
+        selected += [SPECIAL_IDX[key] <= selected_indices for key in SPECIAL_OPTIONS_ORDER]
+        lines = [MENU_HEADER]
         for i in range(total_options):
             indicator = " ✨ " if i == current_index else "  "
-            if i < num_options:
-                role_name = AVAILABLE_ROLES[i]
-                status = "[✔]" if i in selected_indices else "[ ]"
-                color = Colors.GREEN if i in selected_indices else ""
-                print(f"{indicator} {color}{status}{Colors.NC} {role_name}")
-            else: # Special options
-                special_key = special_options_order[i - num_options]
-                special_roles = special_options[special_key]
-                # Check if all roles in this special option are selected
-                is_selected = True
-                for r_name in special_roles:
-                    try:
-                        if AVAILABLE_ROLES.index(r_name) not in selected_indices:
-                            is_selected = False
-                            break
-                    except ValueError: # Should not happen if roles are consistent
-                        is_selected = False
-                        break
-
-                status = "[✔]" if is_selected else "[ ]"
-                color = Colors.GREEN if is_selected else ""
-                desc = 'all except cloud-init' if special_key == 'all' else 'all roles including cloud-init'
-                print(f"{indicator} {color}{status}{Colors.NC} {special_key} ({desc})")
-        print("-" * 80)
-
-    # Key reading logic differs for Windows and Linux/macOS
-    if os.name == 'nt': # Windows
-        import msvcrt
-        while True:
-            print_menu()
-            key = msvcrt.getch()
-
-            if key == b'\xe0': # Arrow key prefix
-                arrow_key = msvcrt.getch()
-                if arrow_key == b'H': # Up
-                    current_index = (current_index - 1) % total_options
-                elif arrow_key == b'P': # Down
-                    current_index = (current_index + 1) % total_options
-            elif key == b'\r': # Enter
+            lines.append(indicator + (LINE_SEL[i] if selected[i] else LINE_UNSEL[i]))
+        lines.append(MENU_RULE)
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+
+    key_iter = get_key_iter()
+    try:
+        print_menu()
+        for key in key_iter:
+            if key == "UP":
+                current_index = (current_index - 1) % total_options
+            elif key == "DOWN":
+                current_index = (current_index + 1) % total_options
+            elif key == "ENTER":
                 # Validate at least one selection
-                if not selected_indices and not any(
-                    all(AVAILABLE_ROLES.index(r_name) in selected_indices for r_name in roles)
-                    for roles in special_options.values() if roles
-                ):
-                     log_warning("Please select at least one role or 'all'/'full'.")
-                     time.sleep(2)
-                     continue
+                if not selected_indices:
+                    log_warning("Please select at least one role or 'all'/'full'.")
+                    time.sleep(2)
+                    print_menu()
+                    continue
                 break
-            elif key == b'q': # Quit
+            elif key == "Q":
                 log_info("Exiting without changes.")
                 sys.exit(0)
-            elif key == b' ': # Space
+            elif key == "SPACE":
                 if current_index < num_options:
                     if current_index in selected_indices:
                         selected_indices.remove(current_index)
@@ -227,196 +456,102 @@ def display_menu():
                     # If a regular role is toggled, it might invalidate a special selection
                     # For simplicity, we don't auto-deselect specials here, user can re-toggle
                 else: # Special option
-                    special_key = special_options_order[current_index - num_options]
-                    special_roles_list = special_options[special_key]
-                    
-                    # Check if all roles in this special option are currently selected
-                    all_selected = True
-                    for r_name in special_roles_list:
-                        try:
-                            if AVAILABLE_ROLES.index(r_name) not in selected_indices:
-                                all_selected = False
-                                break
-                        except ValueError:
-                            pass
-                    
-                    if all_selected:
+                    special_idx = SPECIAL_IDX[SPECIAL_OPTIONS_ORDER[current_index - num_options]]
+                    if special_idx.issubset(selected_indices):
                         # Deselect all roles in this special option
-                        for r_name in special_roles_list:
-                            try:
-                                selected_indices.remove(AVAILABLE_ROLES.index(r_name))
-                            except ValueError:
-                                pass
+                        selected_indices.difference_update(special_idx)
                     else:
                         # Select all roles in this special option
-                        for r_name in special_roles_list:
-                            try:
-                                selected_indices.add(AVAILABLE_ROLES.index(r_name))
-                            except ValueError:
-                                pass
-    else: # Linux/macOS
-        import termios, tty
-        fd = sys.stdin.fileno()
-        old_settings = termios.tcgetattr(fd)
-        try:
-            while True:
-                print_menu()
-                tty.setraw(sys.stdin.fileno())
-                key = sys.stdin.read(1)
-                tty.setcbreak(sys.stdin.fileno())
-
-                if key == '\x1b': # ESC
-                    _ = sys.stdin.read(2) # Read [ or ]
-                    arrow_key = sys.stdin.read(1)
-                    if arrow_key == 'A': # Up
-                        current_index = (current_index - 1) % total_options
-                    elif arrow_key == 'B': # Down
-                        current_index = (current_index + 1) % total_options
-                elif key == '\n': # Enter
-                    if not selected_indices and not any(
-                        all(AVAILABLE_ROLES.index(r_name) in selected_indices for r_name in roles)
-                        for roles in special_options.values() if roles
-                    ):
-                         log_warning("Please select at least one role or 'all'/'full'.")
-                         time.sleep(2)
-                         continue
-                    break
-                elif key == 'q': # Quit
-                    log_info("Exiting without changes.")
-                    sys.exit(0)
-                elif key == ' ': # Space
-                    if current_index < num_options:
-                        if current_index in selected_indices:
-                            selected_indices.remove(current_index)
-                        else:
-                            selected_indices.add(current_index)
-                    else: # Special option
-                        special_key = special_options_order[current_index - num_options]
-                        special_roles_list = special_options[special_key]
-                        
-                        all_selected = True
-                        for r_name in special_roles_list:
-                            try:
-                                if AVAILABLE_ROLES.index(r_name) not in selected_indices:
-                                    all_selected = False
-                                    break
-                            except ValueError:
-                                pass
-                        
-                        if all_selected:
-                            for r_name in special_roles_list:
-                                try:
-                                    selected_indices.remove(AVAILABLE_ROLES.index(r_name))
-                                except ValueError:
-                                    pass
-                        else:
-                            for r_name in special_roles_list:
-                                try:
-                                    selected_indices.add(AVAILABLE_ROLES.index(r_name))
-                                except ValueError:
-                                    pass
-        finally:
-            termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
-
-    # Process selected indices into role names
-    selected_role_names = []
-    for idx in sorted(list(selected_indices)): # Sort for consistent order
-        if idx < num_options:
-            selected_role_names.append(AVAILABLE_ROLES[idx])
-    
-    # Check if any special option is fully selected and add its roles
-    for special_key, roles_list in special_options.items():
-        is_fully_selected = True
-        for r_name in roles_list:
-            try:
-                if AVAILABLE_ROLES.index(r_name) not in selected_indices:
-                    is_fully_selected = False
-                    break
-            except ValueError:
-                is_fully_selected = False
-                break
-        if is_fully_selected:
-            # Add roles from this special option, avoiding duplicates if already added by individual selection
-            for r_name in roles_list:
-                if r_name not in selected_role_names:
-                    selected_role_names.append(r_name)
-            break # Assuming only one special option can be "active" in terms of full selection
+                        selected_indices.update(special_idx)
+            print_menu()
+    finally:
+        key_iter.close() # Restores the terminal mode on POSIX
 
-    return selected_role_names
+    # Process selected indices into role names; special options only ever add role indices,
+    # so a fully selected 'all'/'full' is already covered here
+    return [AVAILABLE_ROLES[idx] for idx in sorted(selected_indices) if idx < num_options]
 
 # --- Function to Create Inventory File ---
 def create_inventory_file(server_ip, ssh_user, ssh_port, ssh_key_option_val, ssh_key_path_val):
-    log_info(f"Creating inventory file at: {INVENTORY_FILE}")
+    log_info("Creating inventory file at: %s", INVENTORY_FILE)
     os.makedirs(INVENTORY_DIR, exist_ok=True)
     
     server_hostname = f"remote-server-{server_ip.replace('.', '-').replace(':', '-')}" # Make hostname-safe
 
-    inventory_content = DEFAULT_INVENTORY_TEMPLATE.format(
-        server_hostname=server_hostname,
-        server_ip=server_ip,
-        ssh_user=ssh_user,
-        ssh_port=ssh_port,
-        ssh_key_option=ssh_key_option_val if ssh_key_option_val else ""
-    )
-    # Ensure no double newlines if ssh_key_option was empty
-    inventory_content = inventory_content.replace("\n\n", "\n")
-
+    host_parts = [server_hostname, f"ansible_host={server_ip}", f"ansible_user={ssh_user}", f"ansible_port={ssh_port}"]
+    if ssh_key_option_val:
+        host_parts.append(ssh_key_option_val)
+    inventory_content = INVENTORY_GROUP_HEADER + " ".join(host_parts) + "\n" + INVENTORY_GROUP_VARS
 
-    with open(INVENTORY_FILE, "w") as f:
+    # Write-then-rename: an interrupted run can never leave a truncated inventory behind
+    tmp_file = INVENTORY_FILE + ".tmp"
+    with open(tmp_file, "w") as f:
         f.write(inventory_content)
+        if os.environ.get("ANSIBLE_DEPLOY_FAST") != "1": # The rename alone is atomic; fsync adds durability
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_file, INVENTORY_FILE)
     log_success("Inventory file created.")
 
 # --- Main Execution ---
 def main():
     log_info("Starting remote Ansible deployment script (Python)...")
-    log_info(f"Playbook directory: {PLAYBOOK_DIR}")
+    log_info("Playbook directory: %s", PLAYBOOK_DIR)
 
     # 1. Check for Ansible
-    if not shutil.which("ansible-playbook"):
+    if not on_path("ansible-playbook"):
         install_ansible()
     else:
         log_success("Ansible is already installed.")
 
     # 2. Check for Ansible Galaxy collections
-    requirements_file = os.path.join(PLAYBOOK_DIR, "requirements.yml")
-    if os.path.exists(requirements_file):
-        log_info("Installing/updating Ansible collections from requirements.yml...")
-        run_command(["ansible-galaxy", "collection", "install", "-r", requirements_file])
-        log_success("Ansible collections processed.")
+    if os.path.exists(REQUIREMENTS_FILE):
+        if galaxy_requirements_cached(REQUIREMENTS_FILE):
+            log_success("Ansible collections up-to-date (requirements.yml unchanged).")
+        else:
+            log_info("Installing/updating Ansible collections from requirements.yml...")
+            if run_command(["ansible-galaxy", "collection", "install", "-r", REQUIREMENTS_FILE]):
+                record_galaxy_requirements(REQUIREMENTS_FILE)
+            log_success("Ansible collections processed.")
     else:
         log_warning("requirements.yml not found. Skipping collection installation.")
 
     # 3. Prompt for server details
     server_ip, ssh_user, ssh_port, ssh_key_option, ssh_key_path = prompt_for_server_details()
+    if not check_ssh_connectivity(server_ip, ssh_user, ssh_port, ssh_key_path):
+        if not input("Continue anyway? (y/N): ").lower().startswith('y'):
+            sys.exit(1)
 
     # 4. Display interactive menu for role selection
     selected_roles = display_menu()
     if not selected_roles:
         log_error("No roles selected. Exiting.")
         sys.exit(1)
-    log_info(f"Selected roles: {', '.join(selected_roles)}")
+    log_info("Selected roles: %s", ', '.join(selected_roles))
 
     # 5. Create inventory file
     create_inventory_file(server_ip, ssh_user, ssh_port, ssh_key_option, ssh_key_path)
 
     # 6. Run Ansible playbook
-    log_info(f"Running Ansible playbook with selected roles against {server_ip}...")
-    os.chdir(PLAYBOOK_DIR) # Change to playbook directory
-
-    tags_argument = ""
-    if selected_roles:
-        tags_argument = "--tags " + ",".join(f'"{role}"' for role in selected_roles)
+    log_info("Running Ansible playbook with selected roles against %s (forks=%s, strategy=free)...", server_ip, ANSIBLE_FORKS)
+    log_info("Note: when targeting 100+ hosts, raise MaxSessions in the targets' sshd_config to match the fork count.")
 
     ansible_command = ["ansible-playbook", "-i", INVENTORY_FILE, "site.yml"]
-    if tags_argument:
-        ansible_command.extend(tags_argument.split())
+    if selected_roles:
+        # argv goes straight to exec (no shell), so the tag list must not carry literal quotes
+        ansible_command += ["--tags", ",".join(selected_roles)]
+    ansible_command.extend(["-f", str(ANSIBLE_FORKS)])
     ansible_command.extend(["--ask-become-pass", "--ask-pass"]) # For remote, need SSH password too
 
-    if not run_command(ansible_command):
-        log_error(f"Ansible playbook execution failed on {server_ip}. Please check the output above for errors.")
+    ansible_env = os.environ.copy()
+    ansible_env.update(ANSIBLE_RUN_ENV)
+    os.makedirs(FACT_CACHE_DIR, exist_ok=True)
+    # site.yml is resolved relative to the playbook directory
+    if not run_command(ansible_command, env=ansible_env, cwd=PLAYBOOK_DIR):
+        log_error("Ansible playbook execution failed on %s. Please check the output above for errors.", server_ip)
         sys.exit(1)
     else:
-        log_success(f"Ansible playbook executed successfully on {server_ip}.")
+        log_success("Ansible playbook executed successfully on %s.", server_ip)
         log_info("The remote server should now be configured with the selected features.")
 
 if __name__ == "__main__":
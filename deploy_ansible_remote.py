@@ -8,19 +8,51 @@
 import os
 import sys
 import subprocess
-import shutil
-import getpass
 import time
-import ipaddress
+import io
+import re
+import argparse
+from pathlib import Path
+
+from bootstrap_cache import (find_ansible_playbook, detect_package_manager, package_cache_is_fresh,
+                             galaxy_requirements_cached, start_galaxy_install, wait_for_galaxy_install)
 
 # --- Configuration ---
-PLAYBOOK_DIR = os.path.dirname(os.path.abspath(__file__)) # Assumes script is in 'files'
-PLAYBOOK_DIR = os.path.dirname(PLAYBOOK_DIR) # Go up one level to project root
-INVENTORY_DIR = os.path.join(PLAYBOOK_DIR, "inventory")
-INVENTORY_FILE = os.path.join(INVENTORY_DIR, "remote_hosts.ini")
+# Paths are derived from __file__ once at import time; nothing else touches the filesystem on import.
+PLAYBOOK_DIR = Path(__file__).resolve().parent # Script lives at the project root
+INVENTORY_DIR = PLAYBOOK_DIR / "inventory"
+INVENTORY_FILE = INVENTORY_DIR / "remote_hosts.ini"
 # Default inventory template for a single remote server
 DEFAULT_INVENTORY_TEMPLATE = "[remote_servers]\n{server_hostname} ansible_host={server_ip} ansible_user={ssh_user} ansible_port={ssh_port} {ssh_key_option}\n"
-PLAYBOOK_FILE = os.path.join(PLAYBOOK_DIR, "remote_setup.yml")
+PLAYBOOK_FILE = PLAYBOOK_DIR / "remote_setup.yml"
+# RFC 1123 hostname: dot-separated labels of 1-63 alphanumerics/hyphens, no leading/trailing hyphen
+HOSTNAME_RE = re.compile(r'^(?=.{1,253}$)[A-Za-z0-9]([A-Za-z0-9-]{0,61}[A-Za-z0-9])?(\.[A-Za-z0-9]([A-Za-z0-9-]{0,61}[A-Za-z0-9])?)*$')
+# Package metadata younger than PACKAGE_CACHE_MAX_AGE (see bootstrap_cache) is reused instead of refreshed
+APT_UPDATE_STAMP = "/var/lib/apt/periodic/update-success-stamp"
+DNF_MAKECACHE_STAMP = "/var/cache/dnf/last_makecache"
+PACMAN_SYNC_DBS = "/var/lib/pacman/sync/*.db"
+ANSIBLE_FORKS = 25
+SSH_TIMEOUT = 30 # Seconds to wait for an SSH connection
+ANSIBLE_CFG_FILE = INVENTORY_DIR / "remote_ansible.cfg" # Passed via ANSIBLE_CONFIG; leaves a project ansible.cfg alone
+# SSH multiplexing: reuse one connection per host instead of a fresh handshake per task
+SSH_CONTROL_DIR = os.path.expanduser("~/.ansible/cp")
+SSH_ARGS = f"-o ControlMaster=auto -o ControlPersist=600s -o ControlPath={SSH_CONTROL_DIR}/%h-%p-%r"
+# Fact cache: reruns within the timeout skip the setup-module round-trip to the remote
+FACT_CACHE_DIR = os.path.expanduser("~/.cache/ansible-new-setup/facts")
+FACT_CACHE_TIMEOUT = 3600 # Seconds
+ANSIBLE_CFG_TEMPLATE = (
+    "# Generated by deploy_ansible_remote.py - local changes will be overwritten.\n"
+    "[defaults]\n"
+    "gathering = smart\n"
+    "fact_caching = jsonfile\n"
+    "fact_caching_connection = {fact_cache_dir}\n"
+    "fact_caching_timeout = {fact_cache_timeout}\n"
+    "\n"
+    "[ssh_connection]\n"
+    "pipelining = True\n"
+    "retries = 3\n"
+    "ssh_args = {ssh_args}\n"
+)
 
 # --- Color Codes for Output ---
 class Colors:
@@ -32,6 +64,8 @@ class Colors:
     BOLD = '\033[1m'
     NC = '\033[0m' # No Color
 
+CLEAR_SCREEN = '\033[2J\033[H' # Erase display + cursor home; avoids spawning clear/cls
+
 # --- Helper Functions ---
 def log_info(message):
     print(f"{Colors.BLUE}[INFO]{Colors.NC} {message}")
@@ -66,19 +100,33 @@ def run_command(command, check=True, capture_output=False):
         return False
 
 # --- Function to Install Ansible ---
-def install_ansible():
+def install_ansible(refresh_cache=False):
     log_info("Ansible not found. Installing based on your OS...")
-    if shutil.which("apt-get"):
+    pkg_mgr = detect_package_manager(refresh_cache)
+    if pkg_mgr == "apt-get":
         log_info("Using apt-get (Debian/Ubuntu)...")
-        run_command(["sudo", "apt-get", "update"])
-        run_command(["sudo", "apt-get", "install", "-y", "ansible"])
-    elif shutil.which("dnf"):
+        install_cmd = "apt-get install -y ansible"
+        if not package_cache_is_fresh(APT_UPDATE_STAMP):
+            install_cmd = "apt-get update && " + install_cmd
+        else:
+            log_info("apt package lists are up to date. Skipping 'apt-get update'.")
+        # One sudo invocation for both steps
+        run_command(["sudo", "sh", "-c", install_cmd])
+    elif pkg_mgr == "dnf":
         log_info("Using dnf (Fedora/RHEL)...")
-        run_command(["sudo", "dnf", "install", "-y", "ansible"])
-    elif shutil.which("pacman"):
+        dnf_command = ["sudo", "dnf", "install", "-y", "ansible"]
+        if package_cache_is_fresh(DNF_MAKECACHE_STAMP):
+            log_info("dnf metadata is up to date. Skipping metadata refresh.")
+            dnf_command.append("--setopt=metadata_expire=never")
+        run_command(dnf_command)
+    elif pkg_mgr == "pacman":
         log_info("Using pacman (Arch Linux)...")
-        run_command(["sudo", "pacman", "-Sy", "--noconfirm", "ansible"])
-    elif shutil.which("brew"):
+        if package_cache_is_fresh(PACMAN_SYNC_DBS):
+            log_info("pacman sync databases are up to date. Skipping refresh.")
+            run_command(["sudo", "pacman", "-S", "--noconfirm", "ansible"])
+        else:
+            run_command(["sudo", "pacman", "-Sy", "--noconfirm", "ansible"])
+    elif pkg_mgr == "brew":
         log_info("Using brew (macOS)...")
         run_command(["brew", "install", "ansible"])
     else:
@@ -88,6 +136,7 @@ def install_ansible():
 
 # --- Function to Prompt for Server Details ---
 def prompt_for_server_details():
+    import ipaddress # Deferred: only needed once we actually prompt, keeps --help/error exits fast
     log_info("Please enter details for the remote server:")
     while True:
         server_ip = input("Server Hostname/IP Address: ").strip()
@@ -99,10 +148,9 @@ def prompt_for_server_details():
             ipaddress.ip_address(server_ip) # Checks for IPv4/IPv6
             break
         except ValueError:
-            # Not an IP, could be a hostname. For simplicity, we'll accept any non-empty string.
-            # More robust hostname validation could be added if needed.
-            if server_ip.replace('-', '').replace('.', '').isalnum() or ' ' not in server_ip : # Basic hostname check
-                 break
+            # Not an IP, could be a hostname
+            if HOSTNAME_RE.match(server_ip):
+                break
             log_warning("Invalid IP address or hostname format. Please try again.")
             continue
 
@@ -153,19 +201,29 @@ AVAILABLE_ROLES = [
 ALL_ROLES_SELECTION = [r for r in AVAILABLE_ROLES if r != "cloud-init"]
 FULL_ROLES_SELECTION = AVAILABLE_ROLES[:]
 
+def render_menu(selected):
+    """Builds the whole menu screen, including the clear-screen escape, as one string."""
+    buf = io.StringIO()
+    buf.write(CLEAR_SCREEN)
+    buf.write(f"{Colors.BOLD}Select roles/features to install on the remote server:{Colors.NC}\n")
+    buf.write("Enter numbers to toggle (comma-separated), 'a' for all, 'f' for full, 'q' to quit.\n")
+    buf.write("-" * 80 + "\n")
+    for i, role in enumerate(AVAILABLE_ROLES):
+        status = "[x]" if role in selected else "[ ]"
+        buf.write(f"{i+1:2d}. {status} {role}\n")
+    all_status = "[x]" if selected.issuperset(ALL_ROLES_SELECTION) else "[ ]"
+    full_status = "[x]" if selected.issuperset(FULL_ROLES_SELECTION) else "[ ]"
+    buf.write(f"{len(AVAILABLE_ROLES)+1:2d}. {all_status} all (all except cloud-init)\n")
+    buf.write(f"{len(AVAILABLE_ROLES)+2:2d}. {full_status} full (all roles including cloud-init)\n")
+    buf.write("-" * 80 + "\n")
+    return buf.getvalue()
+
 def display_menu():
-    selected_role_names = []
+    selected = set()
     while True:
-        os.system('clear' if os.name == 'posix' else 'cls')
-        print(f"{Colors.BOLD}Select roles/features to install on the remote server:{Colors.NC}")
-        print("Enter numbers to toggle (comma-separated), 'a' for all, 'f' for full, 'q' to quit.")
-        print("-" * 80)
-        for i, role in enumerate(AVAILABLE_ROLES):
-            status = "[x]" if role in selected_role_names else "[ ]"
-            print(f"{i+1:2d}. {status} {role}")
-        print(f"{len(AVAILABLE_ROLES)+1:2d}. [ ] all (all except cloud-init)")
-        print(f"{len(AVAILABLE_ROLES)+2:2d}. [ ] full (all roles including cloud-init)")
-        print("-" * 80)
+        # One write per redraw instead of a print() per line
+        sys.stdout.write(render_menu(selected))
+        sys.stdout.flush()
         
         user_input = input("Your choice (e.g., '1,3,5', 'a', 'f', 'q'): ").strip().lower()
         
@@ -173,30 +231,29 @@ def display_menu():
             log_info("Exiting without changes.")
             sys.exit(0)
         elif user_input == 'a':
-            selected_role_names = list(set(ALL_ROLES_SELECTION))
+            selected = set(ALL_ROLES_SELECTION)
         elif user_input == 'f':
-            selected_role_names = list(set(FULL_ROLES_SELECTION))
+            selected = set(FULL_ROLES_SELECTION)
         else:
             try:
                 parts = user_input.split(',')
-                new_selections = []
                 for part in parts:
                     part = part.strip()
                     if part.isdigit():
                         idx = int(part) - 1
                         if 0 <= idx < len(AVAILABLE_ROLES):
-                            new_selections.append(AVAILABLE_ROLES[idx])
+                            selected ^= {AVAILABLE_ROLES[idx]} # Toggle
                     elif part == 'a':
-                        new_selections.extend(ALL_ROLES_SELECTION)
+                        selected |= set(ALL_ROLES_SELECTION)
                     elif part == 'f':
-                        new_selections.extend(FULL_ROLES_SELECTION)
-                # Remove duplicates and update
-                selected_role_names = list(set(selected_role_names + new_selections))
+                        selected |= set(FULL_ROLES_SELECTION)
             except ValueError:
                 log_warning("Invalid input. Please try again.")
                 time.sleep(2)
                 continue
         
+        # Report selections in the canonical role order
+        selected_role_names = [role for role in AVAILABLE_ROLES if role in selected]
         if not selected_role_names and user_input not in ['q', 'a', 'f']:
             log_warning("Please select at least one role or 'a'/'f'.")
             time.sleep(2)
@@ -225,27 +282,73 @@ def create_inventory_file(server_ip, ssh_user, ssh_port, ssh_key_option_val, ssh
     # Ensure no double newlines if ssh_key_option was empty
     inventory_content = inventory_content.replace("\n\n", "\n")
 
-    with open(INVENTORY_FILE, "w") as f:
+    # Leave an identical file untouched so its mtime (and any inventory/fact cache) stays valid
+    try:
+        with open(INVENTORY_FILE) as f:
+            if f.read() == inventory_content:
+                log_info("Inventory unchanged.")
+                return
+    except FileNotFoundError:
+        pass
+
+    # Write-then-rename so an interrupted run never leaves a truncated inventory behind
+    tmp_file = INVENTORY_FILE.with_name(INVENTORY_FILE.name + ".tmp")
+    with open(tmp_file, "w") as f:
         f.write(inventory_content)
+    os.replace(tmp_file, INVENTORY_FILE)
     log_success("Inventory file created.")
 
+# --- Function to Configure SSH Connection Reuse and Fact Caching ---
+def configure_ansible():
+    log_info("Enabling SSH pipelining, connection multiplexing and fact caching...")
+    os.makedirs(SSH_CONTROL_DIR, exist_ok=True)
+    os.makedirs(FACT_CACHE_DIR, exist_ok=True)
+    # Environment takes precedence over any ansible.cfg Ansible might pick up first
+    os.environ["ANSIBLE_PIPELINING"] = "True"
+    os.environ["ANSIBLE_SSH_ARGS"] = SSH_ARGS
+    os.environ["ANSIBLE_CONFIG"] = str(ANSIBLE_CFG_FILE)
+    content = ANSIBLE_CFG_TEMPLATE.format(ssh_args=SSH_ARGS, fact_cache_dir=FACT_CACHE_DIR,
+                                          fact_cache_timeout=FACT_CACHE_TIMEOUT)
+    try:
+        if ANSIBLE_CFG_FILE.read_text() == content:
+            return
+    except OSError:
+        pass
+    ANSIBLE_CFG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    ANSIBLE_CFG_FILE.write_text(content)
+    log_success(f"Ansible configuration written to: {ANSIBLE_CFG_FILE}")
+
 # --- Main Execution ---
+def parse_args():
+    parser = argparse.ArgumentParser(description="Deploy the Ansible setup to a remote server.")
+    parser.add_argument("--refresh-cache", action="store_true",
+                        help="Ignore cached ansible-playbook/package manager lookups and probe again.")
+    parser.add_argument("--force-galaxy", action="store_true",
+                        help="Reinstall Ansible Galaxy collections even if requirements.yml is unchanged.")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    if os.name == 'nt':
+        os.system('') # Lets the Windows console interpret ANSI escape sequences
     log_info("Starting remote Ansible deployment script (Python)...")
     log_info(f"Playbook directory: {PLAYBOOK_DIR}")
 
     # 1. Check for Ansible
-    if not shutil.which("ansible-playbook"):
-        install_ansible()
+    if not find_ansible_playbook(args.refresh_cache):
+        install_ansible(args.refresh_cache)
     else:
         log_success("Ansible is already installed.")
 
     # 2. Check for Ansible Galaxy collections
-    requirements_file = os.path.join(PLAYBOOK_DIR, "requirements.yml")
-    if os.path.exists(requirements_file):
-        log_info("Installing/updating Ansible collections from requirements.yml...")
-        run_command(["ansible-galaxy", "collection", "install", "-r", requirements_file])
-        log_success("Ansible collections processed.")
+    requirements_file = PLAYBOOK_DIR / "requirements.yml"
+    galaxy_job = None
+    if requirements_file.exists():
+        if not args.force_galaxy and galaxy_requirements_cached(requirements_file):
+            log_success("Galaxy collections up-to-date (cached).")
+        else:
+            # Runs in the background while the user answers the prompts below
+            galaxy_job = start_galaxy_install(requirements_file, log_info, log_error)
     else:
         log_warning("requirements.yml not found. Skipping collection installation.")
 
@@ -263,17 +366,22 @@ def main():
     create_inventory_file(server_ip, ssh_user, ssh_port, ssh_key_option, ssh_key_path)
 
     # 6. Run Ansible playbook
+    wait_for_galaxy_install(galaxy_job, requirements_file, log_info, log_success, log_error)
     log_info(f"Running Ansible playbook with selected roles against {server_ip}...")
     os.chdir(PLAYBOOK_DIR) # Change to playbook directory
+    configure_ansible()
 
-    tags_argument = ""
+    ansible_command = ["ansible-playbook", "-i", str(INVENTORY_FILE), str(PLAYBOOK_FILE)]
     if selected_roles:
-        tags_argument = "--tags " + ",".join(f'"{role}"' for role in selected_roles)
-
-    ansible_command = ["ansible-playbook", "-i", INVENTORY_FILE, PLAYBOOK_FILE]
-    if tags_argument:
-        ansible_command.extend(tags_argument.split())
-    ansible_command.extend(["--ask-become-pass", "--ask-pass"]) # For remote, need SSH password too
+        # argv is passed without a shell, so the tag list must not carry literal quotes
+        tags = ",".join(selected_roles)
+        ansible_command += ["--tags", tags]
+        log_info(f"Effective --tags: {tags}")
+    ansible_command.extend(["--forks", str(ANSIBLE_FORKS), "--timeout", str(SSH_TIMEOUT)])
+    ansible_command.append("--ask-become-pass")
+    if not ssh_key_path:
+        # Key-based logins authenticate once over the multiplexed connection; only prompt for a password without a key
+        ansible_command.append("--ask-pass")
 
     if not run_command(ansible_command):
         log_error(f"Ansible playbook execution failed on {server_ip}. Please check the output above for errors.")
@@ -9,9 +9,21 @@ Assisted by Cline on 2025-10-02.
 import os
 import sys
 import subprocess
-import shutil
+import collections
+import argparse
+import concurrent.futures
+from pathlib import Path
 
-PLAYBOOK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # Project root
+PLAYBOOK_DIR = Path(__file__).resolve().parents[2]  # Project root (script lives in files/cloud-init)
+OUTPUT_TAIL_LINES = 200  # Lines of ansible output kept for error reports
+VARIANT_VARS_FILES = {
+    "minimal": "files/cloud-init/minimal.yml",
+    "dev": "files/cloud-init/dev.yml",
+    "full": "files/cloud-init/full.yml"
+}
+# bootstrap_cache lives at the project root
+sys.path.insert(0, str(PLAYBOOK_DIR))
+from bootstrap_cache import find_ansible_playbook
 
 def log_info(message):
     print(f"[INFO] {message}")
@@ -22,8 +34,12 @@ def log_success(message):
 def log_error(message):
     print(f"[ERROR] {message}", file=sys.stderr)
 
-def run_ansible_generate(variant, extra_vars_file, output_path):
-    """Run Ansible to generate cloud-config for a variant."""
+def run_ansible_generate(variant, extra_vars_file, output_path, prefix_output=False):
+    """Run Ansible to generate cloud-config for a variant.
+
+    With prefix_output, each output line is tagged with the variant name so
+    concurrent runs stay readable.
+    """
     inventory = "localhost,"  # Local connection for generation
     command = [
         "ansible-playbook",
@@ -35,13 +51,19 @@ def run_ansible_generate(variant, extra_vars_file, output_path):
         "--extra-vars", f"cloud_init_path={output_path} @{extra_vars_file}"
     ]
     log_info(f"Generating {variant} config...")
-    try:
-        result = subprocess.run(command, cwd=PLAYBOOK_DIR, check=True, text=True, capture_output=True)
-        log_success(f"Generated {output_path}")
-        return True
-    except subprocess.CalledProcessError as e:
-        log_error(f"Failed to generate {variant}: {e.stderr}")
+    # Stream output live and keep only the last lines around for error reporting
+    tail = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+    proc = subprocess.Popen(command, cwd=PLAYBOOK_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            text=True, bufsize=1)
+    for line in proc.stdout:
+        tail.append(line)
+        sys.stdout.write(f"[{variant}] {line}" if prefix_output else line)
+    proc.stdout.close()
+    if proc.wait() != 0:
+        log_error(f"Failed to generate {variant}:\n{''.join(tail)}")
         return False
+    log_success(f"Generated {output_path}")
+    return True
 
 def prompt_for_variant():
     """Prompt user for variant or custom selection."""
@@ -77,27 +99,47 @@ def prompt_for_variant():
     else:
         return {"variant": choice}
 
+def generate_all_variants():
+    """Generate every predefined variant concurrently; returns True if all succeeded."""
+    # Each ansible-playbook run is an independent localhost process writing its own file,
+    # so threads are enough to overlap them - the heavy lifting happens in the children.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(VARIANT_VARS_FILES)) as executor:
+        futures = {
+            executor.submit(run_ansible_generate, variant, vars_file,
+                            f"files/cloud-init/cloud-config-{variant}.yaml", True): variant
+            for variant, vars_file in VARIANT_VARS_FILES.items()
+        }
+        failed = [futures[future] for future in concurrent.futures.as_completed(futures) if not future.result()]
+    if failed:
+        log_error(f"Failed variants: {', '.join(sorted(failed))}")
+        return False
+    log_success(f"Generated all variants: {', '.join(VARIANT_VARS_FILES)}")
+    return True
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate cloud-init configurations via Ansible.")
+    parser.add_argument("--all", action="store_true",
+                        help="Generate the minimal, dev and full variants in parallel without prompting.")
+    parser.add_argument("--refresh-cache", action="store_true",
+                        help="Ignore the cached ansible-playbook lookup and probe again.")
+    return parser.parse_args()
+
 def main():
-    if not shutil.which("ansible-playbook"):
+    args = parse_args()
+    if not find_ansible_playbook(args.refresh_cache):
         log_error("Ansible not found. Install Ansible first.")
         sys.exit(1)
+
+    if args.all:
+        sys.exit(0 if generate_all_variants() else 1)
     
     selection = prompt_for_variant()
     variant = selection["variant"]
     output_base = f"files/cloud-init/cloud-config-{variant}"
     
-    if variant == "minimal":
-        vars_file = "files/cloud-init/minimal.yml"
-        output_path = f"{output_base}.yaml"
-        run_ansible_generate("minimal", vars_file, output_path)
-    elif variant == "dev":
-        vars_file = "files/cloud-init/dev.yml"
-        output_path = f"{output_base}.yaml"
-        run_ansible_generate("dev", vars_file, output_path)
-    elif variant == "full":
-        vars_file = "files/cloud-init/full.yml"
+    if variant in VARIANT_VARS_FILES:
         output_path = f"{output_base}.yaml"
-        run_ansible_generate("full", vars_file, output_path)
+        run_ansible_generate(variant, VARIANT_VARS_FILES[variant], output_path)
     else:  # custom
         # Create temp vars file for custom
         temp_vars = f"{output_base}-custom-vars.yml"
@@ -2,7 +2,8 @@
 # Local Ansible Installation and Configuration Script (Python)
 # This script installs Ansible (if not present) and then runs the Ansible playbook
 # to configure the local machine based on user-selected features.
-# Includes an interactive menu for role selection.
+# Includes an interactive menu for role selection: a numbered prompt by default, or an
+# arrow-key menu with ANSIBLE_SETUP_MENU=arrows (what install_ansible-2.py sets).
 # Assisted by Cline on 2025-09-30.
 
 import os
@@ -11,13 +12,43 @@ import subprocess
 import shutil
 import getpass
 import time
+import tempfile
+import json
+import re
+import unicodedata
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from bootstrap_cache import (package_cache_is_fresh, on_path,
+                             galaxy_requirements_cached, start_galaxy_install, wait_for_galaxy_install)
 
 # --- Configuration ---
-PLAYBOOK_DIR = os.path.dirname(os.path.abspath(__file__)) # Assumes script is in 'files'
-PLAYBOOK_DIR = os.path.dirname(PLAYBOOK_DIR) # Go up one level to project root
+PLAYBOOK_DIR = os.path.dirname(os.path.abspath(__file__)) # Script lives at the project root
 INVENTORY_FILE = os.path.join(PLAYBOOK_DIR, "inventory", "hosts.ini")
+ANSIBLE_CFG_FILE = os.path.join(PLAYBOOK_DIR, "inventory", "ansible.cfg") # Passed via ANSIBLE_CONFIG
+# Regenerated each run; must sit next to roles/ and group_vars/ so relative paths resolve
+SELECTED_ROLES_PLAYBOOK = os.path.join(PLAYBOOK_DIR, ".selected_roles.yml")
 DEFAULT_INVENTORY = "[localhost]\nlocalhost ansible_connection=local\n"
-PLAYBOOK_FILE = os.path.join(PLAYBOOK_DIR, "local_setup.yml")
+MITOGEN_STRATEGY = "mitogen_free" # Used only when ansible_mitogen is importable and supports our ansible-core
+MITOGEN_ENV_VAR = "ANSIBLE_SETUP_MITOGEN" # "0" keeps the default strategy even when Mitogen is usable
+# Supported-release bounds in ansible_mitogen/loaders.py; newer releases declare only the minimum
+MITOGEN_VERSION_BOUND_RE = re.compile(r"^ANSIBLE_VERSION_(MIN|MAX)\s*=\s*\((\d+),\s*(\d+)", re.MULTILINE)
+APT_LISTS_DIR = "/var/lib/apt/lists" # mtime bumps on every 'apt-get update'
+APT_LISTS_MAX_AGE = 86400 # Seconds before the apt package lists are refreshed again
+FACT_CACHE_DIR = os.path.expanduser("~/.cache/ansible-new-setup/facts")
+ANSIBLE_CFG_TEMPLATE = (
+    f"# Generated by {os.path.basename(__file__)} - local changes will be overwritten.\n"
+    "[defaults]\n"
+    "forks = 20\n"
+    "strategy = free\n"
+    "gathering = smart\n"
+    "fact_caching = jsonfile\n"
+    "fact_caching_connection = {fact_cache_dir}\n"
+    "\n"
+    "[ssh_connection]\n"
+    "pipelining = True\n"
+    "control_path = %(directory)s/%%h-%%p-%%r\n"
+)
 
 # --- Color Codes for Output ---
 class Colors:
@@ -29,24 +60,43 @@ class Colors:
     BOLD = '\033[1m'
     NC = '\033[0m' # No Color
 
+CLEAR_SCREEN = '\033[2J\033[H' # Erase display + cursor home; avoids spawning clear/cls
+
 # --- Helper Functions ---
+def _log_prefix(tag, color, stream):
+    """Builds a log prefix once; plain when NO_COLOR is set or the stream isn't a terminal."""
+    if os.environ.get("NO_COLOR") or not stream.isatty():
+        return f"[{tag}] "
+    return f"{color}[{tag}]{Colors.NC} "
+
+_INFO_PREFIX = _log_prefix("INFO", Colors.BLUE, sys.stdout)
+_SUCCESS_PREFIX = _log_prefix("SUCCESS", Colors.GREEN, sys.stdout)
+_WARNING_PREFIX = _log_prefix("WARNING", Colors.YELLOW, sys.stdout)
+_ERROR_PREFIX = _log_prefix("ERROR", Colors.RED, sys.stderr)
+
 def log_info(message):
-    print(f"{Colors.BLUE}[INFO]{Colors.NC} {message}")
+    sys.stdout.write(_INFO_PREFIX + message + "\n")
 
 def log_success(message):
-    print(f"{Colors.GREEN}[SUCCESS]{Colors.NC} {message}")
+    sys.stdout.write(_SUCCESS_PREFIX + message + "\n")
 
 def log_warning(message):
-    print(f"{Colors.YELLOW}[WARNING]{Colors.NC} {message}")
+    sys.stdout.write(_WARNING_PREFIX + message + "\n")
 
 def log_error(message):
-    print(f"{Colors.RED}[ERROR]{Colors.NC} {message}", file=sys.stderr)
+    sys.stderr.write(_ERROR_PREFIX + message + "\n")
 
-def run_command(command, check=True, capture_output=False):
-    """Runs a shell command and returns the result."""
+def run_command(command, check=True, capture_output=False, env=None):
+    """Runs a shell command and returns the result. env, if given, replaces the child's environment.
+
+    With no timeout, subprocess.run() waits in a blocking waitpid() that returns as soon as the
+    child exits; there is no sleep/poll loop to replace with a pidfd.
+    Keep the call free of preexec_fn and shell=True: on Linux, CPython (3.10+) then starts the
+    child with vfork(), so the interpreter's memory is never copied or COW-mapped.
+    """
     log_info(f"Executing: {' '.join(command)}")
     try:
-        result = subprocess.run(command, check=check, capture_output=capture_output, text=True, encoding='utf-8')
+        result = subprocess.run(command, check=check, capture_output=capture_output, text=True, encoding='utf-8', env=env)
         if capture_output:
             return result.stdout.strip(), result.stderr.strip()
         return result.returncode == 0
@@ -62,20 +112,36 @@ def run_command(command, check=True, capture_output=False):
             log_error(f"Return code: {e.returncode}")
         return False
 
+def exec_command(command, env):
+    """Replaces this process with command, so its exit status becomes ours; returns only on failure."""
+    log_info(f"Executing: {' '.join(command)}")
+    sys.stdout.flush() # Anything still buffered would be lost with the old process image
+    sys.stderr.flush()
+    try:
+        os.execvpe(command[0], command, env)
+    except OSError as e:
+        log_error(f"Could not run {command[0]}: {e.strerror}")
+        sys.exit(1)
+
 # --- Function to Install Ansible ---
 def install_ansible():
     log_info("Ansible not found. Installing based on your OS...")
-    if shutil.which("apt-get"):
+    if on_path("apt-get"):
         log_info("Using apt-get (Debian/Ubuntu)...")
-        run_command(["sudo", "apt-get", "update"])
-        run_command(["sudo", "apt-get", "install", "-y", "ansible"])
-    elif shutil.which("dnf"):
+        install_cmd = "apt-get install -y ansible"
+        if not package_cache_is_fresh(APT_LISTS_DIR, APT_LISTS_MAX_AGE):
+            install_cmd = "apt-get update && " + install_cmd
+        else:
+            log_info("apt package lists are less than a day old. Skipping 'apt-get update'.")
+        # One sudo invocation (and one password prompt) for both steps
+        run_command(["sudo", "sh", "-c", install_cmd])
+    elif on_path("dnf"):
         log_info("Using dnf (Fedora/RHEL)...")
         run_command(["sudo", "dnf", "install", "-y", "ansible"])
-    elif shutil.which("pacman"):
+    elif on_path("pacman"):
         log_info("Using pacman (Arch Linux)...")
         run_command(["sudo", "pacman", "-Sy", "--noconfirm", "ansible"])
-    elif shutil.which("brew"):
+    elif on_path("brew"):
         log_info("Using brew (macOS)...")
         run_command(["brew", "install", "ansible"])
     else:
@@ -83,6 +149,74 @@ def install_ansible():
         sys.exit(1)
     log_success("Ansible installed successfully.")
 
+# --- Mitogen Strategy Plugin ---
+@functools.lru_cache(maxsize=None)
+def ansible_core_version():
+    """Returns the (major, minor) version of the ansible-core behind the ansible-playbook on $PATH.
+
+    Read from this interpreter's package metadata, so it is None unless ansible-playbook's
+    shebang names this very interpreter; another Python may have a different ansible-core.
+    """
+    import importlib.metadata # Deferred: pulls in email/zipfile, needed only when Mitogen is installed
+    ansible_playbook = shutil.which("ansible-playbook")
+    try:
+        with open(ansible_playbook, encoding="utf-8") as f:
+            shebang = f.readline()
+    except (TypeError, OSError, UnicodeDecodeError): # TypeError: not on $PATH
+        return None
+    words = shebang[2:].split() if shebang.startswith("#!") else []
+    if len(words) >= 2 and os.path.basename(words[0]) == "env":
+        words = [shutil.which(words[1])]
+    if not words or not words[0] or os.path.normpath(words[0]) != os.path.normpath(sys.executable):
+        return None
+    try:
+        major, minor = importlib.metadata.version("ansible-core").split(".")[:2]
+        return int(major), int(minor)
+    except (importlib.metadata.PackageNotFoundError, ValueError):
+        return None
+
+def mitogen_supported_range(strategy_plugins):
+    """Returns the (min, max) ansible-core versions ansible_mitogen accepts; max is None if unbounded."""
+    loaders_file = os.path.join(os.path.dirname(os.path.dirname(strategy_plugins)), "loaders.py")
+    try:
+        with open(loaders_file, encoding="utf-8") as f:
+            bounds = {kind: (int(major), int(minor)) for kind, major, minor in MITOGEN_VERSION_BOUND_RE.findall(f.read())}
+    except OSError:
+        return None
+    return (bounds["MIN"], bounds.get("MAX")) if "MIN" in bounds else None
+
+def find_mitogen_strategy_plugins():
+    """Returns the ansible_mitogen strategy plugin directory, or None if Mitogen isn't installed."""
+    import importlib.util
+    spec = importlib.util.find_spec("ansible_mitogen")
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    plugins_dir = os.path.join(list(spec.submodule_search_locations)[0], "plugins", "strategy")
+    return plugins_dir if os.path.isdir(plugins_dir) else None
+
+def ansible_playbook_env():
+    """Returns the environment for ansible-playbook: our generated ansible.cfg, plus Mitogen when usable."""
+    # ANSIBLE_CONFIG wins over ./ansible.cfg, ~/.ansible.cfg and /etc/ansible/ansible.cfg
+    env = {**os.environ, "ANSIBLE_CONFIG": ANSIBLE_CFG_FILE}
+    if os.environ.get(MITOGEN_ENV_VAR) == "0":
+        log_info(f"Mitogen disabled by {MITOGEN_ENV_VAR}=0; using the default strategy.")
+        return env
+    strategy_plugins = find_mitogen_strategy_plugins()
+    if not strategy_plugins:
+        log_info("Mitogen not found; using the default strategy ('pip install --user mitogen' speeds up runs).")
+        return env
+    # An unsupported ansible-core makes the strategy plugin fail every run, so anything unverified is skipped
+    version, supported = ansible_core_version(), mitogen_supported_range(strategy_plugins)
+    if version is None or supported is None:
+        log_warning("Could not check Mitogen against the installed ansible-core; using the default strategy.")
+        return env
+    if version < supported[0] or (supported[1] is not None and version > supported[1]):
+        log_warning(f"Mitogen doesn't support ansible-core {version[0]}.{version[1]}; using the default strategy.")
+        return env
+    log_info(f"Using the {MITOGEN_STRATEGY} strategy from {strategy_plugins}")
+    env.update(ANSIBLE_STRATEGY_PLUGINS=strategy_plugins, ANSIBLE_STRATEGY=MITOGEN_STRATEGY)
+    return env
+
 # --- Function to Display Interactive Menu ---
 AVAILABLE_ROLES = [
     "os-detection", "prerequisites", "base-installs", "docker-setup",
@@ -92,50 +226,118 @@ AVAILABLE_ROLES = [
 
 ALL_ROLES_SELECTION = [r for r in AVAILABLE_ROLES if r != "cloud-init"]
 FULL_ROLES_SELECTION = AVAILABLE_ROLES[:]
+ROLE_TO_IDX = {name: i for i, name in enumerate(AVAILABLE_ROLES)}
+# Menu indices covered by each special option
+SPECIAL_IDX = {
+    "all": frozenset(ROLE_TO_IDX[r] for r in ALL_ROLES_SELECTION),
+    "full": frozenset(ROLE_TO_IDX[r] for r in FULL_ROLES_SELECTION),
+}
+
+MENU_STYLE_ENV_VAR = "ANSIBLE_SETUP_MENU" # "arrows" selects the arrow-key menu
+MENU_HEADER_LINES = 3 # Title, instructions and top rule, before the first option line
+PROMPT_MENU_PROMPT = "Your choice (e.g., '1,3,5', 'a', 'f', 'q'): "
+# Longest line the numbered menu prints below its prompt: the confirmation with every role selected
+PROMPT_MENU_LONGEST_CONFIRM = f"Selected: {', '.join(FULL_ROLES_SELECTION)}. Confirm? (y/N): y"
+ESCAPE_TIMEOUT = 0.05 # Seconds to wait for the rest of an escape sequence after a lone ESC
+ANSI_ESCAPE_RE = re.compile(r"\033\[[0-9;]*[A-Za-z]")
+
+def screen_rows(text, columns):
+    """Returns how many rows text occupies on a terminal columns wide, counting wrapped lines."""
+    plain = ANSI_ESCAPE_RE.sub("", text)
+    width = sum(2 if unicodedata.east_asian_width(ch) in ("W", "F") else 1 for ch in plain)
+    return max(1, -(-width // columns))
+
+def line_start_rows(lines, columns):
+    """Returns the 1-based screen row each line starts on when lines are printed from the top of
+    the screen, followed by the row just below the last line."""
+    rows = [1]
+    for line in lines:
+        rows.append(rows[-1] + screen_rows(line, columns))
+    return rows
 
 def display_menu():
-    selected_role_names = []
+    if os.environ.get(MENU_STYLE_ENV_VAR) == "arrows":
+        return display_arrow_menu()
+    return display_prompt_menu()
+
+def display_prompt_menu():
+    """Numbered menu: type comma-separated numbers to toggle roles, then confirm."""
+    selected_role_names = {} # Insertion-ordered set: role name -> None
+
+    def role_line(i, role):
+        status = "[x]" if role in selected_role_names else "[ ]"
+        return f"{i+1:2d}. {status} {role}"
+
+    def menu_lines():
+        lines = [
+            f"{Colors.BOLD}Select roles/features to install on your local machine:{Colors.NC}",
+            "Enter numbers to toggle (comma-separated), 'a' for all, 'f' for full, 'q' to quit.",
+            "-" * 80,
+        ]
+        lines += [role_line(i, role) for i, role in enumerate(AVAILABLE_ROLES)]
+        lines += [
+            f"{len(AVAILABLE_ROLES)+1:2d}. [ ] all (all except cloud-init)",
+            f"{len(AVAILABLE_ROLES)+2:2d}. [ ] full (all roles including cloud-init)",
+            "-" * 80,
+        ]
+        return lines
+
+    drawn_columns = None # Terminal width at the last full draw
     while True:
-        os.system('clear' if os.name == 'posix' else 'cls')
-        print(f"{Colors.BOLD}Select roles/features to install on your local machine:{Colors.NC}")
-        print("Enter numbers to toggle (comma-separated), 'a' for all, 'f' for full, 'q' to quit.")
-        print("-" * 80)
-        for i, role in enumerate(AVAILABLE_ROLES):
-            status = "[x]" if role in selected_role_names else "[ ]"
-            print(f"{i+1:2d}. {status} {role}")
-        print(f"{len(AVAILABLE_ROLES)+1:2d}. [ ] all (all except cloud-init)")
-        print(f"{len(AVAILABLE_ROLES)+2:2d}. [ ] full (all roles including cloud-init)")
-        print("-" * 80)
-        
-        user_input = input("Your choice (e.g., '1,3,5', 'a', 'f', 'q'): ").strip().lower()
+        columns, height = shutil.get_terminal_size()
+        lines = menu_lines()
+        # Lines wider than the terminal wrap, so row positions come from each line's wrapped height
+        rows = line_start_rows(lines, columns)
+        prompt_row = rows[-1]
+        # Cursor addressing is only safe if nothing has reflowed (same width as the full draw) and
+        # nothing will scroll: the menu, the prompt and the longest confirmation must all fit.
+        below_menu = screen_rows(PROMPT_MENU_PROMPT, columns) + screen_rows(PROMPT_MENU_LONGEST_CONFIRM, columns)
+        in_place = height >= prompt_row + below_menu
+        if in_place and drawn_columns == columns:
+            sys.stdout.write(f"\033[{prompt_row};1H\033[J") # Back to the prompt; erase old prompts/warnings
+        else:
+            sys.stdout.write(CLEAR_SCREEN + "\n".join(lines) + "\n")
+            drawn_columns = columns
+        previous_selection = set(selected_role_names)
+
+        answer = input(PROMPT_MENU_PROMPT)
+        user_input = answer.strip().lower()
         
         if user_input == 'q':
             log_info("Exiting without changes.")
             sys.exit(0)
         elif user_input == 'a':
-            selected_role_names = list(set(ALL_ROLES_SELECTION))
+            selected_role_names = dict.fromkeys(ALL_ROLES_SELECTION)
         elif user_input == 'f':
-            selected_role_names = list(set(FULL_ROLES_SELECTION))
+            selected_role_names = dict.fromkeys(FULL_ROLES_SELECTION)
         else:
             try:
                 parts = user_input.split(',')
-                new_selections = []
                 for part in parts:
                     part = part.strip()
                     if part.isdigit():
                         idx = int(part) - 1
                         if 0 <= idx < len(AVAILABLE_ROLES):
-                            new_selections.append(AVAILABLE_ROLES[idx])
+                            role = AVAILABLE_ROLES[idx]
+                            if role in selected_role_names:
+                                selected_role_names.pop(role)
+                            else:
+                                selected_role_names[role] = None
                     elif part == 'a':
-                        new_selections.extend(ALL_ROLES_SELECTION)
+                        selected_role_names.update(dict.fromkeys(ALL_ROLES_SELECTION))
                     elif part == 'f':
-                        new_selections.extend(FULL_ROLES_SELECTION)
-                # Remove duplicates and update
-                selected_role_names = list(set(selected_role_names + new_selections))
+                        selected_role_names.update(dict.fromkeys(FULL_ROLES_SELECTION))
             except ValueError:
                 log_warning("Invalid input. Please try again.")
                 time.sleep(2)
                 continue
+
+        if in_place:
+            # Rewrite only the rows whose checkbox flipped, then park below the answered prompt
+            for role in previous_selection.symmetric_difference(selected_role_names):
+                i = ROLE_TO_IDX[role]
+                sys.stdout.write(f"\033[{rows[MENU_HEADER_LINES + i]};1H\033[K{role_line(i, role)}")
+            sys.stdout.write(f"\033[{prompt_row + screen_rows(PROMPT_MENU_PROMPT + answer, columns)};1H")
         
         if not selected_role_names and user_input not in ['q', 'a', 'f']:
             log_warning("Please select at least one role or 'a'/'f'.")
@@ -146,7 +348,161 @@ def display_menu():
         if confirm == 'y':
             break
             
-    return selected_role_names
+    return list(selected_role_names)
+
+def display_arrow_menu():
+    """Arrow-key menu: UP/DOWN to move, SPACE to toggle, Enter to confirm."""
+    selected_indices = set()
+    current_index = 0
+    num_options = len(AVAILABLE_ROLES)
+    special_options = {"all": ALL_ROLES_SELECTION, "full": FULL_ROLES_SELECTION}
+    special_options_order = ["all", "full"]
+    total_options = num_options + len(special_options)
+
+    special_rows = range(num_options, total_options)
+
+    def menu_line(i):
+        indicator = " ✨ " if i == current_index else "   "
+        if i < num_options:
+            role_name = AVAILABLE_ROLES[i]
+            status = "[✔]" if i in selected_indices else "[ ]"
+            color = Colors.GREEN if i in selected_indices else ""
+            return f"{indicator} {color}{status}{Colors.NC} {role_name}"
+        # Special options
+        special_key = special_options_order[i - num_options]
+        # Selected when all roles in this special option are selected
+        is_selected = SPECIAL_IDX[special_key].issubset(selected_indices)
+        status = "[✔]" if is_selected else "[ ]"
+        color = Colors.GREEN if is_selected else ""
+        desc = 'all except cloud-init' if special_key == 'all' else 'all roles including cloud-init'
+        return f"{indicator} {color}{status}{Colors.NC} {special_key} ({desc})"
+
+    drawn_columns = None # Terminal width at the last full draw
+
+    def menu_lines():
+        lines = [
+            f"{Colors.BOLD}Select roles/features to install on your local machine:{Colors.NC}",
+            f"Use {Colors.CYAN}UP/DOWN{Colors.NC} arrows to navigate, {Colors.CYAN}SPACE{Colors.NC} to select/deselect, {Colors.CYAN}Enter{Colors.NC} to confirm, {Colors.CYAN}Q{Colors.NC} to quit.",
+            "-" * 80,
+        ]
+        lines += [menu_line(i) for i in range(total_options)]
+        lines.append("-" * 80)
+        return lines
+
+    def print_menu():
+        nonlocal drawn_columns
+        drawn_columns = shutil.get_terminal_size().columns
+        sys.stdout.write(CLEAR_SCREEN + "\n".join(menu_lines()) + "\n")
+        sys.stdout.flush()
+
+    def redraw_rows(rows):
+        """Rewrites only the given option rows in place, then parks the cursor below the menu."""
+        columns, height = shutil.get_terminal_size()
+        # Lines wider than the terminal wrap, so row positions come from each line's wrapped height
+        line_rows = line_start_rows(menu_lines(), columns)
+        below_menu = line_rows[-1]
+        if columns != drawn_columns or height < below_menu:
+            print_menu() # The menu has reflowed or scrolled, so row addresses are unreliable
+            return
+        out = [f"\033[{line_rows[MENU_HEADER_LINES + i]};1H\033[K{menu_line(i)}" for i in rows]
+        out.append(f"\033[{below_menu};1H")
+        sys.stdout.write("".join(out))
+        sys.stdout.flush()
+
+    # Key reading logic differs for Windows and Linux/macOS
+    if os.name == 'nt': # Windows
+        import msvcrt
+        while True:
+            print_menu()
+            key = msvcrt.getch()
+
+            if key == b'\xe0': # Arrow key prefix
+                arrow_key = msvcrt.getch()
+                if arrow_key == b'H': # Up
+                    current_index = (current_index - 1) % total_options
+                elif arrow_key == b'P': # Down
+                    current_index = (current_index + 1) % total_options
+            elif key == b'\r': # Enter
+                # Validate at least one selection
+                if not selected_indices:
+                     log_warning("Please select at least one role or 'all'/'full'.")
+                     time.sleep(2)
+                     continue
+                break
+            elif key == b'q': # Quit
+                log_info("Exiting without changes.")
+                sys.exit(0)
+            elif key == b' ': # Space
+                if current_index < num_options:
+                    if current_index in selected_indices:
+                        selected_indices.remove(current_index)
+                    else:
+                        selected_indices.add(current_index)
+                    # If a regular role is toggled, it might invalidate a special selection
+                    # For simplicity, we don't auto-deselect specials here, user can re-toggle
+                else: # Special option
+                    special_idx = SPECIAL_IDX[special_options_order[current_index - num_options]]
+                    if special_idx.issubset(selected_indices): # Deselect all roles in this special option
+                        selected_indices -= special_idx
+                    else: # Select all roles in this special option
+                        selected_indices |= special_idx
+    else: # Linux/macOS
+        import termios, tty, select
+        fd = sys.stdin.fileno()
+        old_settings = termios.tcgetattr(fd)
+        try:
+            # Set once: unbuffered keys without echo; output post-processing and Ctrl-C keep working
+            tty.setcbreak(fd)
+            print_menu()
+            while True:
+                # Only keys that change something redraw, and then only the rows they affect
+                # os.read rather than sys.stdin.read so select() sees bytes not yet pulled into a buffer
+                key = os.read(fd, 1)
+
+                if key == b'\x1b': # ESC, either alone or the start of an arrow key sequence
+                    if not select.select([fd], [], [], ESCAPE_TIMEOUT)[0]:
+                        continue # Lone ESC; don't block waiting for a sequence that isn't coming
+                    if os.read(fd, 1) not in (b'[', b'O'):
+                        continue
+                    arrow_key = os.read(fd, 1)
+                    previous_index = current_index
+                    if arrow_key == b'A': # Up
+                        current_index = (current_index - 1) % total_options
+                    elif arrow_key == b'B': # Down
+                        current_index = (current_index + 1) % total_options
+                    if current_index != previous_index:
+                        redraw_rows((previous_index, current_index))
+                elif key in (b'\r', b'\n'): # Enter
+                    if not selected_indices:
+                         log_warning("Please select at least one role or 'all'/'full'.")
+                         time.sleep(2)
+                         print_menu()
+                         continue
+                    break
+                elif key == b'q': # Quit
+                    log_info("Exiting without changes.")
+                    sys.exit(0)
+                elif key == b' ': # Space
+                    if current_index < num_options:
+                        if current_index in selected_indices:
+                            selected_indices.remove(current_index)
+                        else:
+                            selected_indices.add(current_index)
+                        redraw_rows((current_index, *special_rows)) # 'all'/'full' may flip too
+                    else: # Special option
+                        special_idx = SPECIAL_IDX[special_options_order[current_index - num_options]]
+                        if special_idx.issubset(selected_indices): # Deselect all roles in this special option
+                            selected_indices -= special_idx
+                        else: # Select all roles in this special option
+                            selected_indices |= special_idx
+                        redraw_rows(range(total_options))
+        finally:
+            termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
+
+    # Process selected indices into role names; special options only ever add role indices,
+    # so a fully selected 'all'/'full' is already covered here
+    return [AVAILABLE_ROLES[idx] for idx in sorted(selected_indices) if idx < num_options]
+
 
 # --- Function to Create Inventory File ---
 def create_inventory_file():
@@ -156,23 +512,155 @@ def create_inventory_file():
         f.write(DEFAULT_INVENTORY)
     log_success("Inventory file created.")
 
+# --- Function to Write the Selected-Roles Playbook ---
+def write_selected_roles_playbook(selected_roles, playbook_file=SELECTED_ROLES_PLAYBOOK, always_roles=()):
+    """Writes a single play that applies only selected_roles, in menu order; returns its path.
+
+    Roles in always_roles are tagged 'always', so all of their tasks run even under --tags.
+    """
+    roles = sorted(selected_roles, key=ROLE_TO_IDX.__getitem__)
+    play = {
+        "name": "Local Ansible Setup (selected roles)",
+        "hosts": "localhost",
+        "become": True,
+        "gather_facts": True, # os-detection relies on this
+        "vars_files": ["group_vars/all.yml"],
+        "roles": [{"role": role, "tags": ["always"]} if role in always_roles else role for role in roles],
+    }
+    # JSON is valid YAML, so this needs no YAML library in the interpreter running the script
+    with open(playbook_file, "w") as f:
+        f.write("---\n" + json.dumps([play], indent=2) + "\n")
+    return playbook_file
+
+# --- Functions to Run Independent Roles in Parallel ---
+# Roles that, apart from their package installs, only touch the target user's own files and don't
+# depend on one another
+INDEPENDENT_ROLES = frozenset({"fonts", "terminals", "nvim-setup", "shell-customize"})
+# Tag on the package-manager tasks of parallel roles; concurrent apt/dnf runs fail on the package lock
+PACKAGES_TAG = "packages"
+# An independent role runs concurrently only if it ships roles/<role>/PARALLEL_OPT_IN_FILE, which
+# promises that every package-manager task (apt, dnf, pacman, package, ...) in it is tagged PACKAGES_TAG.
+# Untagged installs would race for the package lock, so roles without the file run sequentially.
+PARALLEL_OPT_IN_FILE = "parallel-safe"
+BECOME_PASSWORD_FILE_MIN_VERSION = (2, 12) # ansible-core release that added --become-password-file
+
+def parallel_opted_in(role):
+    """Returns True if role ships PARALLEL_OPT_IN_FILE."""
+    return os.path.isfile(os.path.join(PLAYBOOK_DIR, "roles", role, PARALLEL_OPT_IN_FILE))
+
+def supports_become_password_file():
+    """Returns True if ansible-playbook has --become-password-file and /dev/fd exists to hand it a pipe."""
+    version = ansible_core_version() # None if unknown; then the single --ask-become-pass run is used
+    return version is not None and version >= BECOME_PASSWORD_FILE_MIN_VERSION and os.path.isdir("/dev/fd")
+
+def run_with_become_password(command, password, **kwargs):
+    """subprocess.run() for an ansible-playbook command, handing it password through a pipe.
+
+    The password never touches the disk, and the pipe disappears with the last process holding it,
+    even if this script is killed.
+    """
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, password.encode() + b"\n") # Far below the pipe buffer size, so this can't block
+    os.close(write_fd)
+    try:
+        command = command + ["--become-password-file", f"/dev/fd/{read_fd}"]
+        return subprocess.run(command, pass_fds=(read_fd,), **kwargs)
+    finally:
+        os.close(read_fd)
+
+def run_roles_in_parallel(roles, extra_roles, password, env):
+    """Runs each of roles (preceded by extra_roles) in its own ansible-playbook concurrently.
+
+    Output is captured per run and printed as each finishes, so the runs don't interleave.
+    Tasks tagged PACKAGES_TAG are skipped; they must already have run one play at a time.
+    Returns True if every run succeeded.
+    """
+    def run_single_role(role):
+        fd, playbook_file = tempfile.mkstemp(prefix=".selected_roles-", suffix=".yml", dir=PLAYBOOK_DIR)
+        os.close(fd)
+        try:
+            write_selected_roles_playbook(extra_roles + [role], playbook_file)
+            command = ["ansible-playbook", "-i", INVENTORY_FILE, playbook_file, "--skip-tags", PACKAGES_TAG]
+            result = run_with_become_password(command, password, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                              text=True, encoding='utf-8', env=env)
+            return role, result.returncode, result.stdout
+        finally:
+            os.remove(playbook_file)
+
+    log_info(f"Running {', '.join(roles)} in parallel...")
+    all_ok = True
+    with ThreadPoolExecutor(max_workers=len(roles)) as executor:
+        for future in as_completed([executor.submit(run_single_role, role) for role in roles]):
+            role, returncode, output = future.result()
+            log_info(f"--- {role} ---")
+            print(output.rstrip())
+            if returncode == 0:
+                log_success(f"Role {role} finished.")
+            else:
+                log_error(f"Role {role} failed (return code {returncode}).")
+                all_ok = False
+    return all_ok
+
+# --- Function to Write ansible.cfg ---
+def write_ansible_cfg():
+    """Writes ANSIBLE_CFG_FILE with pipelining, forks, the free strategy and fact caching enabled."""
+    content = ANSIBLE_CFG_TEMPLATE.format(fact_cache_dir=FACT_CACHE_DIR)
+    try:
+        with open(ANSIBLE_CFG_FILE) as f:
+            if f.read() == content:
+                return
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(ANSIBLE_CFG_FILE), exist_ok=True)
+    os.makedirs(FACT_CACHE_DIR, exist_ok=True)
+    with open(ANSIBLE_CFG_FILE, "w") as f:
+        f.write(content)
+    log_success(f"Ansible configuration written to: {ANSIBLE_CFG_FILE}")
+
+def run_playbooks_with_parallel_roles(selected_roles, parallel_roles, env):
+    """Runs the other selected roles and the package tasks of parallel_roles in one playbook,
+    then the rest of parallel_roles concurrently."""
+    # One password prompt shared by every run; concurrent --ask-become-pass prompts would fight over the TTY
+    password = getpass.getpass("BECOME password: ")
+    sequential_roles = [role for role in selected_roles if role not in parallel_roles]
+    # The other roles run in full, and the parallel ones only their package tasks, all in one play so
+    # that no two package managers ever run at once
+    playbook_file = write_selected_roles_playbook(selected_roles, always_roles=sequential_roles)
+    command = ["ansible-playbook", "-i", INVENTORY_FILE, playbook_file, "--tags", PACKAGES_TAG]
+    log_info(f"Executing: {' '.join(command)}")
+    if run_with_become_password(command, password, env=env).returncode != 0:
+        log_error("Ansible playbook execution failed. Please check the output above for errors.")
+        sys.exit(1)
+    # Facts set by os-detection live only in the run that executed it, so each parallel run repeats it
+    extra_roles = ["os-detection"] if "os-detection" in selected_roles else []
+    if not run_roles_in_parallel(parallel_roles, extra_roles, password, env):
+        log_error("Ansible playbook execution failed. Please check the output above for errors.")
+        sys.exit(1)
+    log_success("Ansible playbook executed successfully.")
+    log_info("Your local machine should now be configured with the selected features.")
+    log_info("You might need to log out and log back in for all changes (e.g., shell changes) to take full effect.")
+
 # --- Main Execution ---
 def main():
+    if os.name == 'nt':
+        os.system('') # Lets the Windows console interpret ANSI escape sequences
     log_info("Starting local Ansible setup script (Python)...")
     log_info(f"Playbook directory: {PLAYBOOK_DIR}")
 
     # 1. Check for Ansible
-    if not shutil.which("ansible-playbook"):
+    if not on_path("ansible-playbook"):
         install_ansible()
     else:
         log_success("Ansible is already installed.")
 
-    # 2. Check for Ansible Galaxy collections
+    # 2. Check for Ansible Galaxy collections; the install overlaps with the menu below
     requirements_file = os.path.join(PLAYBOOK_DIR, "requirements.yml")
+    galaxy_job = None
     if os.path.exists(requirements_file):
-        log_info("Installing/updating Ansible collections from requirements.yml...")
-        run_command(["ansible-galaxy", "collection", "install", "-r", requirements_file])
-        log_success("Ansible collections processed.")
+        if galaxy_requirements_cached(requirements_file):
+            log_success("Ansible collections up-to-date (requirements.yml unchanged).")
+        else:
+            galaxy_job = start_galaxy_install(requirements_file, log_info, log_error)
     else:
         log_warning("requirements.yml not found. Skipping collection installation.")
 
@@ -183,32 +671,31 @@ def main():
         sys.exit(1)
     log_info(f"Selected roles: {', '.join(selected_roles)}")
 
-    # 4. Create inventory file
+    # 4. Create inventory file and ansible.cfg
     create_inventory_file()
+    write_ansible_cfg()
 
-    # 5. Run Ansible playbook
+    # 5. Run Ansible playbook once the collections it needs are in place
+    wait_for_galaxy_install(galaxy_job, requirements_file, log_info, log_success, log_error)
     log_info("Running Ansible playbook with selected roles...")
     os.chdir(PLAYBOOK_DIR) # Change to playbook directory
 
-    tags_argument = ""
-    if selected_roles:
-        # Quote tags if they contain spaces or special characters, though unlikely for role names
-        tags_argument = "--tags " + ",".join(f'"{role}"' for role in selected_roles)
+    ansible_env = ansible_playbook_env()
+    parallel_roles = [role for role in selected_roles if role in INDEPENDENT_ROLES and parallel_opted_in(role)]
+    if len(parallel_roles) >= 2 and supports_become_password_file():
+        run_playbooks_with_parallel_roles(selected_roles, parallel_roles, ansible_env)
+        return
 
     # Run the playbook
+    # Only the selected roles are in the generated play, so Ansible neither loads nor tag-filters the rest
+    ansible_command = ["ansible-playbook", "-i", INVENTORY_FILE, write_selected_roles_playbook(selected_roles)]
     # Using --ask-become-pass is good practice for roles that require sudo
-    ansible_command = ["ansible-playbook", "-i", INVENTORY_FILE, PLAYBOOK_FILE]
-    if tags_argument:
-        ansible_command.extend(tags_argument.split())
     ansible_command.append("--ask-become-pass")
 
-    if not run_command(ansible_command):
-        log_error("Ansible playbook execution failed. Please check the output above for errors.")
-        sys.exit(1)
-    else:
-        log_success("Ansible playbook executed successfully.")
-        log_info("Your local machine should now be configured with the selected features.")
-        log_info("You might need to log out and log back in for all changes (e.g., shell changes) to take full effect.")
+    # Nothing left to do afterwards, so ansible-playbook takes over this process
+    log_info("Once the playbook succeeds, your local machine will be configured with the selected features.")
+    log_info("You might need to log out and log back in for all changes (e.g., shell changes) to take full effect.")
+    exec_command(ansible_command, ansible_env)
 
 if __name__ == "__main__":
     main()